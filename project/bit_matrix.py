@@ -0,0 +1,299 @@
+import numpy as np
+from scipy import sparse
+
+DENSITY_THRESHOLD = 0.02
+WORD_SIZE = 64
+# smaller matrices are not packed: a row of a few words does not pay for the conversions
+MIN_PACKED_SIZE = 2 * WORD_SIZE
+CHUNK_WORDS = 1 << 22
+
+
+def popcount(words: np.ndarray) -> int:
+    """
+    :param words: array of unsigned integers
+    :return: number of set bits in all words
+    """
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+    return int(np.unpackbits(words.view(np.uint8)).sum(dtype=np.int64))
+
+
+def density(matrix) -> float:
+    """
+    :param matrix: sparse matrix or PackedBitMatrix
+    :return: share of nonzero entries
+    """
+    size = matrix.shape[0] * matrix.shape[1]
+    return matrix.nnz / size if size > 0 else 0.0
+
+
+def to_sparse(matrix) -> sparse.csr_matrix:
+    """
+    Convert a matrix of any backend to boolean csr matrix
+    :param matrix: sparse matrix, numpy array or PackedBitMatrix
+    :return: csr matrix with dtype bool
+    """
+    if isinstance(matrix, PackedBitMatrix):
+        return matrix.tocsr()
+    return sparse.csr_matrix(matrix, dtype=bool)
+
+
+def to_backend(matrix, density_threshold: float = DENSITY_THRESHOLD):
+    """
+    Choose representation of a boolean matrix by its density and size
+    :param matrix: sparse matrix or PackedBitMatrix
+    :param density_threshold: matrices with greater density are packed
+    unless one of their dimensions is less than MIN_PACKED_SIZE
+    :return: PackedBitMatrix for dense matrices, csr matrix with dtype bool otherwise
+    """
+    if min(matrix.shape) >= MIN_PACKED_SIZE and density(matrix) > density_threshold:
+        if isinstance(matrix, PackedBitMatrix):
+            return matrix
+        return PackedBitMatrix.from_sparse(matrix)
+    return to_sparse(matrix)
+
+
+def union(matrices, shape):
+    """
+    Boolean sum of matrices without upcast of dtype
+    :param matrices: iterable of csr matrices and PackedBitMatrix
+    :param shape: shape of the result if there are no matrices
+    :return: PackedBitMatrix if some of matrices is packed, csr matrix otherwise
+    """
+    result = None
+    for matrix in matrices:
+        result = matrix if result is None else result + matrix
+    if result is None:
+        return sparse.csr_matrix(shape, dtype=bool)
+    if isinstance(result, PackedBitMatrix):
+        return result
+    return sparse.csr_matrix(result, dtype=bool)
+
+
+class PackedBitMatrix:
+    """
+    Dense boolean matrix, every row is packed into uint64 words,
+    bit j of the row is bit j % 64 of the word j // 64
+    """
+
+    __array_priority__ = 100
+
+    def __init__(self, words: np.ndarray, shape):
+        self.words = words
+        self.shape = tuple(shape)
+
+    @staticmethod
+    def zeros(shape) -> "PackedBitMatrix":
+        words_per_row = -(-shape[1] // WORD_SIZE)
+        return PackedBitMatrix(np.zeros((shape[0], words_per_row), np.uint64), shape)
+
+    @staticmethod
+    def from_dense(array) -> "PackedBitMatrix":
+        """
+        :param array: two-dimensional array, nonzero entries are True
+        :return: packed matrix
+        """
+        array = np.asarray(array, dtype=bool)
+        rows, cols = array.shape
+        words_per_row = -(-cols // WORD_SIZE)
+        padded = np.zeros((rows, words_per_row * WORD_SIZE), dtype=bool)
+        padded[:, :cols] = array
+        packed = np.packbits(padded, axis=1, bitorder="little")
+        return PackedBitMatrix(
+            np.ascontiguousarray(packed).view("<u8").astype(np.uint64), array.shape
+        )
+
+    @staticmethod
+    def from_sparse(matrix) -> "PackedBitMatrix":
+        """
+        :param matrix: sparse matrix, nonzero entries are True
+        :return: packed matrix
+        """
+        matrix = sparse.csr_matrix(matrix, dtype=bool)
+        result = PackedBitMatrix.zeros(matrix.shape)
+        rows, cols = matrix.nonzero()
+        np.bitwise_or.at(
+            result.words,
+            (rows, cols // WORD_SIZE),
+            np.left_shift(np.uint64(1), (cols % WORD_SIZE).astype(np.uint64)),
+        )
+        return result
+
+    @property
+    def nnz(self) -> int:
+        return popcount(self.words)
+
+    @property
+    def T(self) -> "PackedBitMatrix":
+        """
+        Transposition by blocks of rows: the bits of a block are unpacked, transposed
+        and packed into the words of the corresponding columns of the result
+        """
+        rows, cols = self.shape
+        result = PackedBitMatrix.zeros((cols, rows))
+        step = self._rows_per_block()
+        for start in range(0, rows, step):
+            bits = np.zeros((cols, step), dtype=bool)
+            block = _unpack(self.words[start : start + step], cols)
+            bits[:, : block.shape[0]] = block.T
+            words = np.packbits(bits, axis=1, bitorder="little").view("<u8")
+            first = start // WORD_SIZE
+            count = min(words.shape[1], result.words.shape[1] - first)
+            result.words[:, first : first + count] = words[:, :count]
+        return result
+
+    def copy(self) -> "PackedBitMatrix":
+        return PackedBitMatrix(self.words.copy(), self.shape)
+
+    def toarray(self) -> np.ndarray:
+        """
+        :return: boolean numpy array
+        """
+        return _unpack(self.words, self.shape[1])
+
+    def tocsr(self) -> sparse.csr_matrix:
+        rows, cols = self.nonzero()
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=self.shape, dtype=bool
+        )
+
+    def nonzero(self):
+        """
+        Only nonzero words are unpacked, by chunks
+        :return: pair (row indices, column indices) of nonzero entries sorted by rows
+        """
+        rows, word_cols = np.nonzero(self.words)
+        result_rows, result_cols = [rows[:0]], [word_cols[:0]]
+        step = max(CHUNK_WORDS // WORD_SIZE, 1)
+        for start in range(0, len(rows), step):
+            chunk_rows = rows[start : start + step]
+            chunk_cols = word_cols[start : start + step]
+            bits = _unpack(self.words[chunk_rows, chunk_cols][:, None], WORD_SIZE)
+            entries, offsets = np.nonzero(bits)
+            result_rows.append(chunk_rows[entries])
+            result_cols.append(chunk_cols[entries] * WORD_SIZE + offsets)
+        return np.concatenate(result_rows), np.concatenate(result_cols)
+
+    def __getitem__(self, rows) -> "PackedBitMatrix":
+        words = self.words[rows]
+        if words.ndim == 1:
+            words = words[None, :]
+        return PackedBitMatrix(words, (words.shape[0], self.shape[1]))
+
+    def __or__(self, other) -> "PackedBitMatrix":
+        return PackedBitMatrix(self.words | self._words_of(other), self.shape)
+
+    __add__ = __or__
+    __radd__ = __or__
+
+    def __and__(self, other) -> "PackedBitMatrix":
+        return PackedBitMatrix(self.words & self._words_of(other), self.shape)
+
+    def __gt__(self, other) -> "PackedBitMatrix":
+        return PackedBitMatrix(self.words & ~self._words_of(other), self.shape)
+
+    def __matmul__(self, other) -> "PackedBitMatrix":
+        if density(self) > 1 / 8:
+            return _multiply_by_bytes(self, _packed(other))
+        rows, cols = self.nonzero()
+        return _multiply(rows, cols, self.shape[0], _packed(other))
+
+    def __rmatmul__(self, other) -> "PackedBitMatrix":
+        rows, cols = to_sparse(other).nonzero()
+        return _multiply(rows, cols, other.shape[0], self)
+
+    def _rows_per_block(self) -> int:
+        """
+        :return: multiple of WORD_SIZE rows whose unpacked bits take about CHUNK_WORDS bytes
+        """
+        rows = CHUNK_WORDS // max(self.shape[1], 1)
+        return max(rows // WORD_SIZE, 1) * WORD_SIZE
+
+    def _words_of(self, other) -> np.ndarray:
+        if other.shape != self.shape:
+            raise ValueError(f"Shapes {self.shape} and {other.shape} do not match")
+        return _packed(other).words
+
+
+def _unpack(words: np.ndarray, cols: int) -> np.ndarray:
+    """
+    :param words: two-dimensional array of packed rows
+    :param cols: number of columns
+    :return: boolean array of bits of the rows
+    """
+    bits = np.unpackbits(words.astype("<u8").view(np.uint8), axis=1, bitorder="little")
+    return bits[:, :cols].astype(bool)
+
+
+def _packed(matrix) -> PackedBitMatrix:
+    if isinstance(matrix, PackedBitMatrix):
+        return matrix
+    return PackedBitMatrix.from_sparse(matrix)
+
+
+def _multiply(rows, cols, count_of_rows, right: PackedBitMatrix) -> PackedBitMatrix:
+    """
+    Boolean product of the matrix with nonzero entries (rows, cols) and the packed matrix,
+    row i of the result is OR of rows of the right matrix in cols of row i
+    :param rows: sorted row indices of nonzero entries of the left matrix
+    :param cols: column indices of nonzero entries of the left matrix
+    :param count_of_rows: number of rows of the left matrix
+    :param right: right matrix
+    :return: packed product
+    """
+    result = PackedBitMatrix.zeros((count_of_rows, right.shape[1]))
+    words_per_row = max(right.words.shape[1], 1)
+    chunk = max(CHUNK_WORDS // words_per_row, 1)
+    for start in range(0, len(rows), chunk):
+        chunk_rows = rows[start : start + chunk]
+        gathered = right.words[cols[start : start + chunk]]
+        heads = np.flatnonzero(np.diff(chunk_rows, prepend=-1))
+        result.words[chunk_rows[heads]] |= np.bitwise_or.reduceat(
+            gathered, heads, axis=0
+        )
+    return result
+
+
+def _multiply_by_bytes(left: PackedBitMatrix, right: PackedBitMatrix):
+    """
+    Boolean product of dense packed matrices: for every byte of columns of the left matrix
+    all 256 unions of the corresponding 8 rows of the right matrix are tabulated,
+    then every row of the result is updated by one lookup in the table
+    :param left: left matrix
+    :param right: right matrix
+    :return: packed product
+    """
+    result = PackedBitMatrix.zeros((left.shape[0], right.shape[1]))
+    left_bytes = left.words.astype("<u8", copy=False).view(np.uint8)
+    table = np.zeros((256, right.words.shape[1]), dtype=np.uint64)
+    for byte in range(-(-left.shape[1] // 8)):
+        table[:] = 0
+        for bit in range(min(8, left.shape[1] - 8 * byte)):
+            size = 1 << bit
+            table[size : 2 * size] = table[:size] | right.words[8 * byte + bit]
+        result.words |= table[left_bytes[:, byte]]
+    return result
+
+
+def new_entries(found, known):
+    """
+    Entries of found which are not in known, the result has the backend of known
+    :param found: sparse matrix or PackedBitMatrix
+    :param known: sparse matrix or PackedBitMatrix
+    :return: matrix of new entries
+    """
+    if isinstance(known, PackedBitMatrix):
+        return _packed(found) > known
+    return to_sparse(found) > known
+
+
+def vstack(blocks):
+    """
+    Stack matrices of the same backend by rows
+    :param blocks: non-empty list of csr matrices or PackedBitMatrix
+    :return: csr matrix or PackedBitMatrix
+    """
+    if isinstance(blocks[0], PackedBitMatrix):
+        words = np.concatenate([block.words for block in blocks])
+        return PackedBitMatrix(words, (words.shape[0], blocks[0].shape[1]))
+    return sparse.csr_matrix(sparse.vstack(blocks, format="csr"), dtype=bool)
@@ -1,5 +1,262 @@
+import os
+from collections.abc import ItemsView, Mapping
+
+import numpy as np
 from scipy import sparse
-from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, State
+from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, State, Symbol
+
+from project.bit_matrix import (
+    DENSITY_THRESHOLD,
+    PackedBitMatrix,
+    new_entries,
+    to_backend,
+    to_sparse,
+    union,
+    vstack,
+)
+
+
+def iter_nonzero_blocks(matrix, block_size: int = 4096):
+    """
+    Iterate over nonzero entries of a sparse matrix by blocks of rows
+    :param matrix: sparse matrix
+    :param block_size: number of rows in one block
+    :return: generator of pairs (row indices, column indices) of nonzero entries
+    """
+    matrix = sparse.csr_matrix(matrix)
+    for start in range(0, matrix.shape[0], block_size):
+        block = matrix[start : start + block_size]
+        rows, cols = block.nonzero()
+        if len(rows) > 0:
+            yield rows + start, cols
+
+
+def map_products(lefts, rights, executor=None) -> list:
+    """
+    Multiply matrices pairwise, the products are independent and can be computed in parallel
+    :param lefts: iterable of left matrices
+    :param rights: iterable of right matrices
+    :param executor: concurrent.futures.Executor, products are computed sequentially if None
+    :return: list of products
+    """
+    if executor is None:
+        return [left @ right for left, right in zip(lefts, rights)]
+    return list(executor.map(_product, lefts, rights))
+
+
+def multiply_by_row_blocks(left, right, executor=None, count_of_blocks=None):
+    """
+    Multiply matrices splitting the left one by rows into a block per worker
+    :param left: csr matrix or PackedBitMatrix
+    :param right: csr matrix or PackedBitMatrix
+    :param executor: concurrent.futures.Executor, the product is computed at once if None
+    :param count_of_blocks: number of blocks, by default number of workers of the executor
+    :return: product
+    """
+    if executor is None or left.shape[0] < 2:
+        return left @ right
+    if count_of_blocks is None:
+        count_of_blocks = count_of_workers(executor)
+    bounds = np.linspace(0, left.shape[0], min(count_of_blocks, left.shape[0]) + 1)
+    bounds = bounds.astype(int)
+    blocks = [left[begin:end] for begin, end in zip(bounds[:-1], bounds[1:])]
+    products = map_products(blocks, [right] * len(blocks), executor)
+    return vstack(products)
+
+
+def count_of_workers(executor=None) -> int:
+    """
+    :param executor: concurrent.futures.Executor or None
+    :return: number of workers of the executor, number of processors if it is unknown
+    """
+    return getattr(executor, "_max_workers", None) or os.cpu_count() or 1
+
+
+def _product(left, right):
+    return left @ right
+
+
+def to_index_array(values) -> np.ndarray:
+    """
+    Convert values (vertices of a graph, states) to one-dimensional numpy array
+    :param values: list of values ordered by their indices
+    :return: numpy array, its dtype is object unless all values are integers
+    """
+    array = np.asarray(values) if len(values) > 0 else np.empty(0, dtype=int)
+    if array.ndim != 1 or array.dtype.kind not in "biu":
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+    return array
+
+
+class ProductStatesIndices(Mapping):
+    """
+    Implicit indices of states of a product of two automata: the state with index i
+    in the first automaton and index j in the second one is i * second_count + j,
+    states of the product are their own indices
+    """
+
+    def __init__(self, first_count: int, second_count: int):
+        self.first_count, self.second_count = first_count, second_count
+
+    def __getitem__(self, state):
+        if not self._contains(state):
+            raise KeyError(state)
+        return state
+
+    def __contains__(self, state):
+        return self._contains(state)
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def __len__(self):
+        return self.first_count * self.second_count
+
+    def index(self, first_index: int, second_index: int) -> int:
+        """
+        :return: index of the product state for indices of states of the first and the second automata
+        """
+        return first_index * self.second_count + second_index
+
+    def split(self, index: int):
+        """
+        :return: pair of indices of states of the first and the second automata
+        """
+        return divmod(index, self.second_count)
+
+    def _contains(self, state):
+        return isinstance(state, (int, np.integer)) and 0 <= state < len(self)
+
+
+class VertexStatesIndices(Mapping):
+    """
+    Indices of states State(vertex) for a numeric array of vertices, vertices[i] has index i.
+    States are looked up by binary search, so no python object is created per vertex
+    """
+
+    def __init__(self, vertices: np.ndarray):
+        self.vertices = vertices
+        if np.all(vertices[1:] >= vertices[:-1]):
+            self._order, self._sorted = None, vertices
+        else:
+            self._order = np.argsort(vertices, kind="stable")
+            self._sorted = vertices[self._order]
+
+    def __getitem__(self, state):
+        value = state.value if isinstance(state, State) else state
+        if isinstance(value, (int, np.integer)) and len(self._sorted) > 0:
+            position = int(np.searchsorted(self._sorted, value))
+            if position < len(self._sorted) and self._sorted[position] == value:
+                return position if self._order is None else int(self._order[position])
+        raise KeyError(state)
+
+    def __contains__(self, state):
+        try:
+            self[state]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return (State(vertex) for vertex in self.vertices.tolist())
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def items(self):
+        return _VertexStatesItems(self)
+
+
+class _VertexStatesItems(ItemsView):
+    def __iter__(self):
+        return zip(iter(self._mapping), range(len(self._mapping)))
+
+
+class KroneckerProduct:
+    """
+    Lazy Kronecker product of two boolean matrices. Products with it use
+    (A kron B) vec(X) = vec(A X B^T) for row-major vec and never build A kron B
+    """
+
+    __array_priority__ = 100
+
+    def __init__(self, first, second):
+        self.first = to_sparse(first)
+        self.second = to_sparse(second)
+        self.shape = (
+            self.first.shape[0] * self.second.shape[0],
+            self.first.shape[1] * self.second.shape[1],
+        )
+
+    @property
+    def nnz(self) -> int:
+        return self.first.nnz * self.second.nnz
+
+    @property
+    def T(self) -> "KroneckerProduct":
+        return KroneckerProduct(self.first.T, self.second.T)
+
+    def tocsr(self) -> sparse.csr_matrix:
+        """
+        :return: materialized product
+        """
+        return sparse.kron(self.first, self.second, format="csr")
+
+    def nonzero(self):
+        return self.tocsr().nonzero()
+
+    def __matmul__(self, other):
+        if isinstance(other, np.ndarray) and other.ndim == 1:
+            return (self.T.__rmatmul__(other[None, :])).toarray().ravel()
+        return self.T.__rmatmul__(sparse.csr_matrix(other).T).T.tocsr()
+
+    def __rmatmul__(self, other):
+        """
+        Multiply other by the product from the left side: every row x of other is
+        reshaped to X and replaced by vec(A^T X B)
+        :param other: sparse matrix or numpy array with shape[-1] == self.shape[0]
+        :return: sparse matrix or numpy vector
+        """
+        if isinstance(other, np.ndarray) and other.ndim == 1:
+            return self.__rmatmul__(other[None, :]).toarray().ravel()
+
+        other = sparse.coo_matrix(other, dtype=bool)
+        (m1, n1), (m2, n2) = self.first.shape, self.second.shape
+        r = other.shape[0]
+
+        row, col = other.row.astype(np.int64), other.col.astype(np.int64)
+        a, b = np.divmod(col, m2)
+        # X B, rows are pairs (row, a)
+        keys, b = _multiply_rows(row * m1 + a, b, m2, self.second)
+        row, a = np.divmod(keys, m1)
+        # A^T X B, rows are pairs (row, b)
+        keys, a = _multiply_rows(row * n2 + b, a, m1, self.first)
+        row, b = np.divmod(keys, n2)
+
+        return sparse.csr_matrix(
+            (np.ones(len(row), dtype=bool), (row, a * n2 + b)),
+            shape=(r, n1 * n2),
+        )
+
+
+def _multiply_rows(keys, cols, width, matrix):
+    """
+    Multiply the matrix with nonzero entries (keys, cols) by the given matrix,
+    only rows with nonzero entries are allocated
+    :param keys: row indices of nonzero entries, may be large
+    :param cols: column indices of nonzero entries
+    :param width: number of columns
+    :param matrix: right matrix
+    :return: pair (row indices, column indices) of nonzero entries of the product
+    """
+    unique_keys, rows = np.unique(keys, return_inverse=True)
+    product = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=bool), (rows.ravel(), cols)),
+        shape=(len(unique_keys), width),
+    )
+    product = (product @ matrix).tocoo()
+    return unique_keys[product.row], product.col.astype(np.int64)
 
 
 class BoolMatrices:
@@ -27,45 +284,264 @@ class BoolMatrices:
             }
 
             self.count_of_states = len(self.states)
-            self.bool_matrices = dict()
+            label_indices = dict()
             for from_v, label, to_v in nfa:
-                label_matrix = self.bool_matrices.setdefault(
-                    label,
-                    sparse.dok_matrix(
-                        (self.count_of_states, self.count_of_states), dtype=bool
-                    ),
+                rows, cols = label_indices.setdefault(label, ([], []))
+                rows.append(self.states_indices[from_v])
+                cols.append(self.states_indices[to_v])
+
+            self.bool_matrices = {
+                label: sparse.csr_matrix(
+                    (np.ones(len(rows), dtype=bool), (rows, cols)),
+                    shape=(self.count_of_states, self.count_of_states),
+                    dtype=bool,
                 )
-                label_matrix[
-                    self.states_indices[from_v], self.states_indices[to_v]
-                ] = True
+                for label, (rows, cols) in label_indices.items()
+            }
+
+    @staticmethod
+    def from_edges(
+        sources,
+        labels,
+        targets,
+        nodes=None,
+        start_states=None,
+        final_states=None,
+        density_threshold: float = DENSITY_THRESHOLD,
+    ) -> "BoolMatrices":
+        """
+        Build boolean decomposition of a graph from arrays of edges without building nfa
+        :param sources: array of start vertices of edges
+        :param labels: array of labels of edges
+        :param targets: array of end vertices of edges
+        :param nodes: all vertices of the graph, by default vertices of edges
+        :param starts_states: iterable object with initial states, by default all vertices
+        :param final_states: iterable object with final states, by default all vertices
+        :param density_threshold: matrices of labels with greater density are packed into bits
+        :return: boolean decomposition of the graph
+        """
+        sources, targets = to_index_array(sources), to_index_array(targets)
+        labels = to_index_array(labels)
+        if nodes is None:
+            nodes = np.unique(np.concatenate([sources, targets]))
+        nodes = to_index_array(nodes)
+
+        result = BoolMatrices()
+        result.count_of_states = n = len(nodes)
+        states = [State(node) for node in nodes.tolist()]
+        result.states = set(states)
+        result.states_indices = {state: index for index, state in enumerate(states)}
+        result.start_states = (
+            result.states
+            if start_states is None
+            else {State(state) for state in start_states}
+        )
+        result.final_states = (
+            result.states
+            if final_states is None
+            else {State(state) for state in final_states}
+        )
+
+        if nodes.dtype == object:
+            node_indices = {node: index for index, node in enumerate(nodes.tolist())}
+            sources = np.fromiter(
+                (node_indices[node] for node in sources.tolist()), int, len(sources)
+            )
+            targets = np.fromiter(
+                (node_indices[node] for node in targets.tolist()), int, len(targets)
+            )
+        else:
+            order = np.argsort(nodes, kind="stable")
+            sources = order[np.searchsorted(nodes, sources, sorter=order)]
+            targets = order[np.searchsorted(nodes, targets, sorter=order)]
 
-    def intersect(self, other: "BoolMatrices") -> "BoolMatrices":
+        if len(labels) == 0:
+            return result
+
+        unique_labels, label_ids = np.unique(labels, return_inverse=True)
+        order = np.argsort(label_ids, kind="stable")
+        bounds = np.searchsorted(label_ids[order], np.arange(len(unique_labels) + 1))
+        for label_id, label in enumerate(unique_labels.tolist()):
+            edges = order[bounds[label_id] : bounds[label_id + 1]]
+            result.bool_matrices[Symbol(label)] = sparse.csr_matrix(
+                (
+                    np.ones(len(edges), dtype=bool),
+                    (sources[edges], targets[edges]),
+                ),
+                shape=(n, n),
+                dtype=bool,
+            )
+
+        return result.select_backends(density_threshold)
+
+    @staticmethod
+    def from_graph(
+        graph,
+        start_states=None,
+        final_states=None,
+        density_threshold: float = DENSITY_THRESHOLD,
+    ) -> "BoolMatrices":
+        """
+        Build boolean decomposition of a graph without building nfa
+        :param graph: networkx MultiDiGraph with field 'label' on edges
+        or tuple of arrays (sources, labels, targets)
+        :param starts_states: iterable object with initial states, by default all vertices
+        :param final_states: iterable object with final states, by default all vertices
+        :param density_threshold: matrices of labels with greater density are packed into bits
+        :return: boolean decomposition of the graph
+        """
+        if isinstance(graph, tuple):
+            sources, labels, targets = graph
+            return BoolMatrices.from_edges(
+                sources,
+                labels,
+                targets,
+                None,
+                start_states,
+                final_states,
+                density_threshold,
+            )
+
+        edges = [edge for edge in graph.edges(data="label") if edge[2] is not None]
+        sources = [u for u, _, _ in edges]
+        labels = [label for _, _, label in edges]
+        targets = [v for _, v, _ in edges]
+        return BoolMatrices.from_edges(
+            sources,
+            labels,
+            targets,
+            list(graph.nodes),
+            start_states,
+            final_states,
+            density_threshold,
+        )
+
+    def intersect(
+        self,
+        other: "BoolMatrices",
+        lazy: bool = False,
+        density_threshold: float = DENSITY_THRESHOLD,
+    ) -> "BoolMatrices":
         """
         Intersection of two finite automaton in boolean decomposition
         :param other: Another finite automaton in boolean decomposition
+        :param lazy: keep matrices of the result as KroneckerProduct instead of building them
+        :param density_threshold: built matrices with greater density are packed into bits
         :return: result of intersection like bool matrix
         """
         intersect_labels = self.bool_matrices.keys() & other.bool_matrices.keys()
-        result_bool_matrices = {
-            label: sparse.kron(self.bool_matrices[label], other.bool_matrices[label])
-            for label in intersect_labels
-        }
+        if lazy:
+            result_bool_matrices = {
+                label: KroneckerProduct(
+                    self.bool_matrices[label], other.bool_matrices[label]
+                )
+                for label in intersect_labels
+            }
+        else:
+            result_bool_matrices = {
+                label: sparse.kron(
+                    to_sparse(self.bool_matrices[label]),
+                    to_sparse(other.bool_matrices[label]),
+                    format="csr",
+                )
+                for label in intersect_labels
+            }
 
         result = BoolMatrices()
         result.bool_matrices = result_bool_matrices
+        result.count_of_states = self.count_of_states * other.count_of_states
+        result.states_indices = ProductStatesIndices(
+            self.count_of_states, other.count_of_states
+        )
+        result.states = result.states_indices.keys()
 
-        for s1, s_ind1 in self.states_indices.items():
-            for s2, s_ind2 in other.states_indices.items():
-                state = s_ind1 * other.count_of_states + s_ind2
-                result.states_indices[state] = state
+        result.start_states = set(
+            np.flatnonzero(
+                np.kron(self.start_indicator(), other.start_indicator())
+            ).tolist()
+        )
+        result.final_states = set(
+            np.flatnonzero(
+                np.kron(self.final_indicator(), other.final_indicator())
+            ).tolist()
+        )
+
+        return result.select_backends(density_threshold)
+
+    @staticmethod
+    def disjoint_union(automata) -> "BoolMatrices":
+        """
+        Disjoint union of finite automata in boolean decomposition, the matrix of every label
+        is block diagonal and state (i, state) is the state of the i-th automaton
+        :param automata: list of finite automata in boolean decomposition
+        :return: union automaton, states of the i-th automaton have indices
+        from offsets[i] to offsets[i + 1] where offsets are cumulative counts of states
+        """
+        result = BoolMatrices()
+        result.count_of_states = sum(
+            automaton.count_of_states for automaton in automata
+        )
+        labels = set().union(
+            *(automaton.bool_matrices.keys() for automaton in automata)
+        )
 
-                if s1 in self.start_states and s2 in other.start_states:
-                    result.start_states.add(state)
-                if s1 in self.final_states and s2 in other.final_states:
-                    result.final_states.add(state)
+        offset = 0
+        for index, automaton in enumerate(automata):
+            for state, state_index in automaton.states_indices.items():
+                result.states_indices[State((index, state.value))] = (
+                    offset + state_index
+                )
+            result.start_states.update(
+                State((index, state.value)) for state in automaton.start_states
+            )
+            result.final_states.update(
+                State((index, state.value)) for state in automaton.final_states
+            )
+            offset += automaton.count_of_states
+        result.states = set(result.states_indices.keys())
+
+        for label in labels:
+            result.bool_matrices[label] = sparse.block_diag(
+                [
+                    to_sparse(automaton.bool_matrices[label])
+                    if label in automaton.bool_matrices
+                    else sparse.csr_matrix(
+                        (automaton.count_of_states, automaton.count_of_states),
+                        dtype=bool,
+                    )
+                    for automaton in automata
+                ],
+                format="csr",
+                dtype=bool,
+            )
 
         return result
 
+    def start_indicator(self) -> np.ndarray:
+        """
+        :return: boolean vector with True on indices of start states
+        """
+        return self._indicator(self.start_states)
+
+    def final_indicator(self) -> np.ndarray:
+        """
+        :return: boolean vector with True on indices of final states
+        """
+        return self._indicator(self.final_states)
+
+    def _indicator(self, states) -> np.ndarray:
+        if states is self.states:
+            return np.ones(self.count_of_states, dtype=bool)
+        indicator = np.zeros(self.count_of_states, dtype=bool)
+        indicator[
+            [
+                self.states_indices[state]
+                for state in states
+                if state in self.states_indices
+            ]
+        ] = True
+        return indicator
+
     def to_nfa(self) -> NondeterministicFiniteAutomaton:
         """
         Convert bool decomposition to nfa
@@ -85,78 +561,376 @@ class BoolMatrices:
 
         return res_nfa
 
-    def get_transitive_closure(self):
+    def get_transitive_closure(
+        self,
+        squaring: bool = None,
+        density_threshold: float = DENSITY_THRESHOLD,
+        executor=None,
+    ):
         """
         Create transitive closure
+        :param squaring: True to multiply the closure by itself on every step,
+        False to multiply only entries found on the previous step by the adjacency matrix.
+        By default the closure is squared while it is sparse, once it is packed into bits
+        and the adjacency matrix is not, new entries are multiplied by the adjacency matrix
+        :param density_threshold: the closure is packed into bits when its density is greater
+        :param executor: concurrent.futures.Executor to multiply blocks of rows in parallel
         :return: transitive closure
         """
         if len(self.bool_matrices) == 0:
-            return sparse.dok_matrix((0, 0), dtype=bool)
+            return sparse.csr_matrix((0, 0), dtype=bool)
+        if self.is_lazy():
+            return self.get_reachability(np.arange(self.count_of_states))
 
-        transitive_closure = sum(self.bool_matrices.values())
+        adjacency = to_backend(
+            union(
+                self.bool_matrices.values(),
+                (self.count_of_states, self.count_of_states),
+            ),
+            density_threshold,
+        )
+        if squaring is False:
+            return BoolMatrices._extend_by_adjacency(
+                to_sparse(adjacency), adjacency, density_threshold, executor
+            )
+
+        # after k steps the closure holds paths of length at most 2^k
+        previous, transitive_closure = None, adjacency
         prev, cur = 0, transitive_closure.nnz
         while prev != cur:
-            transitive_closure += transitive_closure @ transitive_closure
+            if (
+                squaring is None
+                and isinstance(transitive_closure, PackedBitMatrix)
+                and not isinstance(adjacency, PackedBitMatrix)
+            ):
+                # every longer path starts with a path of length 2^k, found on the last step
+                delta = to_sparse(
+                    transitive_closure
+                    if previous is None
+                    else new_entries(transitive_closure, previous)
+                )
+                return BoolMatrices._extend_by_adjacency(
+                    delta, adjacency, density_threshold, executor, transitive_closure
+                )
+            previous = transitive_closure
+            transitive_closure = to_backend(
+                transitive_closure
+                + multiply_by_row_blocks(
+                    transitive_closure, transitive_closure, executor
+                ),
+                density_threshold,
+            )
             prev = cur
             cur = transitive_closure.nnz
 
-        return transitive_closure
+        return to_sparse(transitive_closure)
+
+    def select_backends(
+        self, density_threshold: float = DENSITY_THRESHOLD
+    ) -> "BoolMatrices":
+        """
+        Pack matrices of labels with density greater than the threshold into bits,
+        other matrices are kept as sparse
+        :param density_threshold: density of matrices to be packed
+        :return: self
+        """
+        self.bool_matrices = {
+            label: matrix
+            if isinstance(matrix, KroneckerProduct)
+            else to_backend(matrix, density_threshold)
+            for label, matrix in self.bool_matrices.items()
+        }
+        return self
+
+    def is_lazy(self) -> bool:
+        """
+        :return: True if some matrices are KroneckerProduct and cannot be summed or squared
+        """
+        return any(
+            isinstance(matrix, KroneckerProduct)
+            for matrix in self.bool_matrices.values()
+        )
+
+    def get_reachability(self, sources):
+        """
+        Multi-source BFS, only products of the front with matrices of labels are used,
+        so it works with lazy matrices too
+        :param sources: indices of source states
+        :return: csr matrix, entry (i, j) is True if state j is reachable from sources[i]
+        by a nonempty path
+        """
+        sources = np.asarray(sources, dtype=int)
+        shape = (len(sources), self.count_of_states)
+        reachable = sparse.csr_matrix(shape, dtype=bool)
+        front = sparse.csr_matrix(
+            (np.ones(len(sources), dtype=bool), (np.arange(len(sources)), sources)),
+            shape=shape,
+        )
+        while front.nnz > 0:
+            step = sparse.csr_matrix(shape, dtype=bool)
+            for matrix in self.bool_matrices.values():
+                step = step + to_sparse(front @ matrix)
+            front = step > reachable
+            reachable = reachable + front
+
+        return reachable
+
+    @staticmethod
+    def update_transitive_closure(
+        closure,
+        edges,
+        adjacency=None,
+        density_threshold: float = DENSITY_THRESHOLD,
+        executor=None,
+    ):
+        """
+        Update transitive closure after adding edges to the graph. Only rows that reach
+        the sources of new entries and columns reachable from their targets are recomputed
+        :param closure: transitive closure of the graph
+        :param edges: adjacency matrix of the added edges
+        :param adjacency: adjacency matrix of the whole graph including added edges,
+        if it is given new entries are multiplied only by it instead of the closure from both sides
+        :param density_threshold: if adjacency is given, the closure and the adjacency matrix
+        are packed into bits when their density is greater
+        :param executor: concurrent.futures.Executor to multiply blocks of rows of new entries
+        by the adjacency matrix in parallel
+        :return: transitive closure of the graph with added edges
+        """
+        closure = sparse.csr_matrix(closure, dtype=bool)
+        edges = sparse.csr_matrix(edges, dtype=bool)
+        if adjacency is not None:
+            adjacency = to_backend(adjacency, density_threshold)
+            edges = edges + closure @ edges
+            closure = to_backend(closure, density_threshold)
+
+        delta = new_entries(edges, closure)
+        closure = closure + delta
+        if adjacency is not None:
+            return BoolMatrices._extend_by_adjacency(
+                delta, adjacency, density_threshold, executor, closure
+            )
+
+        while delta.nnz > 0:
+            sources = np.unique(delta.nonzero()[0])
+            targets = np.unique(delta.nonzero()[1])
+            reach = closure + sparse.identity(
+                closure.shape[0], dtype=bool, format="csr"
+            )
+            paths = reach[:, sources] @ delta[sources][:, targets] @ reach[targets]
+            delta = paths > closure
+            closure = closure + delta
+
+        return to_sparse(closure)
+
+    @staticmethod
+    def _extend_by_adjacency(
+        delta, adjacency, density_threshold, executor, closure=None
+    ):
+        """
+        Extend paths found on the last step by one edge until no new entries appear
+        :param delta: entries found on the last step, they are in the closure
+        :param adjacency: adjacency matrix of the graph
+        :param density_threshold: the closure is packed into bits when its density is greater
+        :param executor: concurrent.futures.Executor to multiply blocks of rows in parallel
+        :param closure: known part of the closure, delta if None
+        :return: transitive closure as csr matrix
+        """
+        closure = to_backend(delta if closure is None else closure, density_threshold)
+        while delta.nnz > 0:
+            delta = new_entries(
+                multiply_by_row_blocks(delta, adjacency, executor), closure
+            )
+            if not isinstance(adjacency, PackedBitMatrix):
+                # a packed delta would pack the sparse adjacency matrix on every step
+                delta = to_sparse(delta)
+            closure = to_backend(closure + delta, density_threshold)
+        return to_sparse(closure)
 
-    def bfs_based_rpq(self, other: "BoolMatrices", separate: bool = False):
+    def bfs_based_rpq(
+        self, other: "BoolMatrices", separate: bool = False, executor=None
+    ):
+        """
+        Multi-source BFS over the direct sum of other and self
+        :param other: finite automaton in boolean decomposition, usually DFA of the request
+        :param separate: return reachable states for every start state separately
+        :param executor: concurrent.futures.Executor to multiply the front by matrices
+        of labels in parallel
+        :return: set of indices of reachable states or set of pairs of indices
+        (start state, reachable state)
+        """
         direct_sum = other._direct_sum(self)
         n, k = self.count_of_states, other.count_of_states
 
-        start_states_indices = [
-            index
-            for index, state in enumerate(self.states)
-            if state in self.start_states
-        ]
-        final_states_indices = [
-            index
-            for index, state in enumerate(self.states)
-            if state in self.final_states
-        ]
-        other_final_states_indices = [
-            index
-            for index, state in enumerate(other.states)
-            if state in other.final_states
-        ]
+        start_states_indices = np.array(
+            [
+                index
+                for index, state in enumerate(self.indexed_states())
+                if state in self.start_states
+            ],
+            dtype=int,
+        )
+        is_final = np.array(
+            [state in self.final_states for state in self.indexed_states()],
+            dtype=bool,
+        )
+        is_other_final = np.array(
+            [state in other.final_states for state in other.indexed_states()],
+            dtype=bool,
+        )
 
         if not separate:
             front = self._make_front(other)
         else:
             front = self._make_separated_front(other)
 
-        visited = sparse.csr_matrix(front.shape)
+        visited = sparse.csr_matrix(front.shape, dtype=bool)
 
         while True:
             prev_visited = visited.copy()
-            for matrix in direct_sum.bool_matrices.values():
-                if front is not None:
-                    front2 = front @ matrix
-                else:
-                    front2 = visited @ matrix
-
-                visited += self._transform_rows(front2, other)
+            if front is None:
+                front = visited
+            matrices = list(direct_sum.bool_matrices.values())
+            for front2 in map_products([front] * len(matrices), matrices, executor):
+                visited = visited + self._transform_rows(front2, other)
 
             front = None
 
             if visited.nnz == prev_visited.nnz:
                 break
 
-        result = set()
-        for i, j in zip(*visited.nonzero()):
-            if (
-                j >= k
-                and i % k in other_final_states_indices
-                and j - k in final_states_indices
-            ):
-                if not separate:
-                    result.add(j - k)
-                else:
-                    result.add((start_states_indices[i // n], j - k))
+        rows, cols = visited.nonzero()
+        rows, cols = rows[cols >= k], cols[cols >= k] - k
+        mask = is_other_final[rows % k] & is_final[cols]
+        rows, cols = rows[mask], cols[mask]
 
-        return result
+        if not separate:
+            return set(cols.tolist())
+        return set(zip(start_states_indices[rows // n].tolist(), cols.tolist()))
+
+    def reachability_bfs_rpq(self, other: "BoolMatrices", separate: bool = False):
+        """
+        Multi-source BFS which keeps the matrices of both automata separate,
+        see reachability_bfs_matrix
+        :param other: finite automaton in boolean decomposition, usually DFA of the request
+        :param separate: return reachable states for every start state separately
+        :return: set of reachable states or set of pairs (start state, reachable state)
+        """
+        states = self.indexed_states()
+        reachable, starts = self.reachability_bfs_matrix(other)
+        rows, cols = reachable.nonzero()
+
+        if not separate:
+            return {states[col].value for col in cols}
+        return {
+            (states[starts[row]].value, states[col].value)
+            for row, col in zip(rows, cols)
+        }
+
+    def reachability_bfs_matrix(self, other: "BoolMatrices", starts=None):
+        """
+        Multi-source BFS which keeps the matrices of both automata separate,
+        see reachability_bfs_states
+        :param other: finite automaton in boolean decomposition, usually DFA of the request
+        :param starts: indices of start states, by default indices of self.start_states
+        :return: pair (csr matrix, indices of start states), entry (i, j) of the matrix is True
+        if final state j is reachable from start state with index starts[i]
+        """
+        n, k = self.count_of_states, other.count_of_states
+        visited, starts = self.reachability_bfs_states(other, starts)
+        s = len(starts)
+
+        is_final = self.final_indicator()
+        is_other_final = other.final_indicator()
+
+        rows, cols = visited.nonzero()
+        mask = is_other_final[rows % k] & is_final[cols]
+        rows, cols = rows[mask] // k, cols[mask]
+
+        reachable = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(s, n), dtype=bool
+        )
+        return reachable, starts
+
+    def reachability_bfs_states(self, other: "BoolMatrices", starts=None):
+        """
+        Multi-source BFS which keeps the matrices of both automata separate. The front has
+        a block of rows for every start state of self, one row per state of other, and is
+        advanced as other_l^T @ front @ self_l per label. Blocks of exhausted start states
+        are dropped from the front
+        :param other: finite automaton in boolean decomposition, usually DFA of the request
+        :param starts: indices of start states, by default indices of self.start_states
+        :return: pair (csr matrix, indices of start states), entry (i * k + q, j) of the matrix
+        is True if state j of self is reachable from start state with index starts[i]
+        together with state q of other by a non-empty word, k is the number of states of other
+        """
+        n, k = self.count_of_states, other.count_of_states
+        if starts is None:
+            starts = np.flatnonzero(self.start_indicator())
+        starts = np.asarray(starts, dtype=int)
+        other_starts = np.array(
+            [other.states_indices[state] for state in other.start_states], dtype=int
+        )
+        labels = self.bool_matrices.keys() & other.bool_matrices.keys()
+        if len(starts) == 0 or len(other_starts) == 0 or len(labels) == 0:
+            return sparse.csr_matrix((len(starts) * k, n), dtype=bool), starts
+
+        s = len(starts)
+        self_matrices = {
+            label: to_sparse(self.bool_matrices[label]) for label in labels
+        }
+        other_matrices = {
+            label: to_sparse(other.bool_matrices[label].T) for label in labels
+        }
+
+        front = sparse.csr_matrix(
+            (
+                np.ones(s * len(other_starts), dtype=bool),
+                (
+                    (np.arange(s)[:, None] * k + other_starts).ravel(),
+                    np.repeat(starts, len(other_starts)),
+                ),
+            ),
+            shape=(s * k, n),
+        )
+        visited = sparse.csr_matrix((s * k, n), dtype=bool)
+        active = np.arange(s)
+
+        while len(active) > 0:
+            a = len(active)
+            step = sparse.csr_matrix((a * k, n), dtype=bool)
+            for label in labels:
+                step = step + (
+                    sparse.kron(
+                        sparse.identity(a, dtype=bool), other_matrices[label], "csr"
+                    )
+                    @ (front @ self_matrices[label])
+                )
+
+            active_rows = (active[:, None] * k + np.arange(k)).ravel()
+            new = step > visited[active_rows]
+            visited = (
+                visited
+                + sparse.csr_matrix(
+                    (np.ones(a * k, dtype=bool), (active_rows, np.arange(a * k))),
+                    shape=(s * k, a * k),
+                )
+                @ new
+            )
+
+            alive = np.diff(new.indptr).reshape(a, k).sum(axis=1) > 0
+            front = new[(np.flatnonzero(alive)[:, None] * k + np.arange(k)).ravel()]
+            active = active[alive]
+
+        return visited, starts
+
+    def indexed_states(self) -> list:
+        """
+        :return: list of states ordered by their indices in the matrices
+        """
+        states = [None] * self.count_of_states
+        for state, index in self.states_indices.items():
+            states[index] = state
+        return states
 
     def _direct_sum(self, other: "BoolMatrices"):
         result = BoolMatrices()
@@ -165,9 +939,10 @@ class BoolMatrices:
         for symbol in symbols:
             result.bool_matrices[symbol] = sparse.bmat(
                 [
-                    [self.bool_matrices[symbol], None],
-                    [None, other.bool_matrices[symbol]],
-                ]
+                    [to_sparse(self.bool_matrices[symbol]), None],
+                    [None, to_sparse(other.bool_matrices[symbol])],
+                ],
+                format="csr",
             )
 
         start_states = {
@@ -177,10 +952,9 @@ class BoolMatrices:
             State(state.value + self.count_of_states) for state in other.final_states
         }
 
-        for first_index in self.states_indices.values():
-            for second_index in other.states_indices.values():
-                state = first_index * other.count_of_states + second_index
-                result.states_indices[state] = state
+        result.states_indices = ProductStatesIndices(
+            self.count_of_states, other.count_of_states
+        )
 
         if not isinstance(self.start_states, set):
             self.start_states = set()
@@ -197,10 +971,10 @@ class BoolMatrices:
 
     def _make_front(self, other: "BoolMatrices"):
         n, k = self.count_of_states, other.count_of_states
-        front = sparse.lil_matrix((k, n + k))
+        front = sparse.lil_matrix((k, n + k), dtype=bool)
 
         right_part = sparse.lil_array(
-            [[state in self.start_states for state in self.states]]
+            [[state in self.start_states for state in self.indexed_states()]]
         )
 
         for index in other.states_indices.values():
@@ -212,7 +986,7 @@ class BoolMatrices:
     def _make_separated_front(self, other: "BoolMatrices"):
         start_indices = {
             index
-            for index, state in enumerate(self.states)
+            for index, state in enumerate(self.indexed_states())
             if state in self.start_states
         }
         fronts = [self._make_front(other) for _ in start_indices]
@@ -221,21 +995,35 @@ class BoolMatrices:
             return sparse.csr_matrix(sparse.vstack(fronts))
         else:
             return sparse.csr_matrix(
-                (other.count_of_states, other.count_of_states + self.count_of_states)
+                (other.count_of_states, other.count_of_states + self.count_of_states),
+                dtype=bool,
             )
 
     def _transform_rows(self, part: sparse.csr_matrix, other: "BoolMatrices"):
-        transformed_part = sparse.lil_array(part.shape)
+        """
+        Move every row of the front to the row of the state reached in other,
+        rows with an empty right part are dropped
+        :param part: product of the front and the direct sum matrix
+        :param other: automaton which states are stored in the left part of the front
+        :return: normalized front
+        """
+        k = other.count_of_states
+        part = to_sparse(part)
+        left, right = part[:, :k].tocoo(), part[:, k:].tocsr()
 
-        for i, j in zip(*part.nonzero()):
-            if j < other.count_of_states:
-                non_zero_right = part.getrow(i).tolil()[[0], other.count_of_states :]
+        has_right = np.diff(right.indptr) > 0
+        mask = has_right[left.row]
+        rows, states = left.row[mask], left.col[mask]
+        shifted_rows = rows // k * k + states
 
-                if non_zero_right.nnz > 0:
-                    shift_row = i // other.count_of_states * other.count_of_states
-                    transformed_part[shift_row + j, j] = 1
-                    transformed_part[
-                        [shift_row + j], other.count_of_states :
-                    ] += non_zero_right
+        values = np.ones(len(rows), dtype=bool)
+        permutation = sparse.csr_matrix(
+            (values, (shifted_rows, rows)), shape=(part.shape[0], part.shape[0])
+        )
+        transformed_left = sparse.csr_matrix(
+            (values, (shifted_rows, states)), shape=(part.shape[0], k)
+        )
 
-        return transformed_part.tocsr()
+        return sparse.hstack(
+            [transformed_left, permutation @ right.astype(bool)], format="csr"
+        )
@@ -1,12 +1,132 @@
+from collections import namedtuple
+from functools import lru_cache
+
 from pyformlang.cfg import CFG
 from textwrap import dedent
 
+WeakCNF = namedtuple(
+    "WeakCNF", ["cfg", "epsilon_heads", "terminal_heads", "pair_heads"]
+)
+
+CNF = namedtuple("CNF", ["cfg", "generates_epsilon"])
+
+CompiledGrammar = namedtuple(
+    "CompiledGrammar",
+    ["variables", "variable_ids", "terminal_heads", "pair_heads", "nullable_heads"],
+)
+
 
 def cfg_to_wсnf(cfg: CFG):
+    """
+    :param cfg: the context-free grammar
+    :return: new grammar in weak Chomsky normal form, it may be modified by the caller
+    """
+    wcfg = get_weak_cnf(cfg).cfg
+    return CFG(start_symbol=wcfg.start_symbol, productions=set(wcfg.productions))
+
+
+def get_weak_cnf(cfg: CFG) -> WeakCNF:
+    """
+    Memoized weak Chomsky normal form of the grammar with lookup tables of its productions,
+    grammars with the same start symbol and productions share one entry
+    :param cfg: the context-free grammar
+    :return: WeakCNF(cfg in weak CNF, frozenset of heads of epsilon productions,
+    dict {terminal value: frozenset of heads}, dict {(variable, variable): frozenset of heads})
+    """
+    return _weak_cnf(cfg.start_symbol, frozenset(cfg.productions))
+
+
+@lru_cache(maxsize=128)
+def _weak_cnf(start_symbol, productions) -> WeakCNF:
+    cfg = CFG(start_symbol=start_symbol, productions=set(productions))
     new_cfg = cfg.eliminate_unit_productions().remove_useless_symbols()
     new_productions = new_cfg._get_productions_with_only_single_terminals()
     new_productions = new_cfg._decompose_productions(new_productions)
-    return CFG(start_symbol=new_cfg._start_symbol, productions=set(new_productions))
+    wcfg = CFG(start_symbol=new_cfg._start_symbol, productions=set(new_productions))
+
+    epsilon_heads, terminal_heads, pair_heads = set(), {}, {}
+    for production in wcfg.productions:
+        if len(production.body) == 0:
+            epsilon_heads.add(production.head)
+        elif len(production.body) == 1:
+            terminal_heads.setdefault(production.body[0].value, set()).add(
+                production.head
+            )
+        else:
+            pair_heads.setdefault(tuple(production.body), set()).add(production.head)
+
+    return WeakCNF(
+        wcfg,
+        frozenset(epsilon_heads),
+        {terminal: frozenset(heads) for terminal, heads in terminal_heads.items()},
+        {pair: frozenset(heads) for pair, heads in pair_heads.items()},
+    )
+
+
+def get_compiled_grammar(cfg: CFG) -> CompiledGrammar:
+    """
+    Memoized weak CNF of the grammar with variables replaced by integer ids
+    :param cfg: the context-free grammar
+    :return: CompiledGrammar(tuple of variables by ids, dict {variable: id},
+    dict {terminal value: bitset of ids of heads},
+    dict {id of left variable * number of variables + id of right variable: tuple of ids of heads},
+    tuple of ids of heads of epsilon productions)
+    """
+    return _compiled_grammar(cfg.start_symbol, frozenset(cfg.productions))
+
+
+def iter_bits(bitset: int):
+    """
+    :param bitset: non-negative integer
+    :return: generator of indices of set bits
+    """
+    while bitset:
+        lowest = bitset & -bitset
+        yield lowest.bit_length() - 1
+        bitset ^= lowest
+
+
+@lru_cache(maxsize=128)
+def _compiled_grammar(start_symbol, productions) -> CompiledGrammar:
+    wcnf = _weak_cnf(start_symbol, productions)
+    variables = tuple(
+        sorted(wcnf.cfg.variables, key=lambda variable: str(variable.value))
+    )
+    variable_ids = {variable: index for index, variable in enumerate(variables)}
+
+    terminal_heads = {}
+    for terminal, heads in wcnf.terminal_heads.items():
+        terminal_heads[terminal] = sum(1 << variable_ids[head] for head in heads)
+
+    pair_heads = {
+        variable_ids[left] * len(variables)
+        + variable_ids[right]: tuple(sorted(variable_ids[head] for head in heads))
+        for (left, right), heads in wcnf.pair_heads.items()
+    }
+
+    return CompiledGrammar(
+        variables,
+        variable_ids,
+        terminal_heads,
+        pair_heads,
+        tuple(sorted(variable_ids[head] for head in wcnf.epsilon_heads)),
+    )
+
+
+def get_cnf(cfg: CFG) -> CNF:
+    """
+    Memoized Chomsky normal form of the grammar, it has no epsilon productions,
+    so whether the grammar generates the empty word is kept separately
+    :param cfg: the context-free grammar
+    :return: CNF(cfg in CNF, True if the empty word is in the language of the grammar)
+    """
+    return _cnf(cfg.start_symbol, frozenset(cfg.productions))
+
+
+@lru_cache(maxsize=128)
+def _cnf(start_symbol, productions) -> CNF:
+    cfg = CFG(start_symbol=start_symbol, productions=set(productions))
+    return CNF(cfg.to_normal_form(), cfg.generate_epsilon())
 
 
 def cfg_from_file(filename: str):
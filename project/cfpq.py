@@ -1,9 +1,24 @@
 import numpy as np
+from collections import defaultdict
 from networkx import MultiDiGraph
 from pyformlang.cfg import CFG, Variable
-from scipy.sparse import dok_matrix
+from pyformlang.finite_automaton import Symbol
+from scipy.sparse import csr_matrix, diags, identity, kron
 from enum import Enum
-from project.cfg_utils import cfg_to_wсnf
+from project.bit_matrix import to_sparse
+from project.bool_matrices import (
+    BoolMatrices,
+    iter_nonzero_blocks,
+    map_products,
+    to_index_array,
+)
+from project.cfg_utils import (
+    CompiledGrammar,
+    get_compiled_grammar,
+    iter_bits,
+)
+from project.ecfg import ECFG
+from project.rsm import RSM
 
 
 def hellings(cfg: CFG, graph: MultiDiGraph):
@@ -13,102 +28,415 @@ def hellings(cfg: CFG, graph: MultiDiGraph):
     :param graph: to analyze
     :return: set of tuples (start node, variable of the cfg, achievable node)
     """
-    wcfg = cfg_to_wсnf(cfg)
+    grammar = get_compiled_grammar(cfg)
+    pair_heads = grammar.pair_heads
+    nodes = list(graph.nodes)
+    node_ids = {node: index for index, node in enumerate(nodes)}
+    k, n = len(grammar.variables), len(nodes)
 
+    # facts (u, var, v) are encoded as (u * k + var) * n + v,
+    # incoming[v] holds u * k + var and outgoing[u] holds var * n + v for every known fact
     result = set()
-    for production in wcfg.productions:
-        if len(production.body) == 0:
-            for node in graph.nodes:
-                result.add((node, production.head, node))
-        elif len(production.body) == 1:
-            for u, v, data in graph.edges(data="label"):
-                if Variable(data) == production.body[0]:
-                    result.add((u, production.head, v))
+    for head in grammar.nullable_heads:
+        result.update((u * k + head) * n + u for u in range(n))
+    for u, v, label in graph.edges(data="label"):
+        u, v = node_ids[u], node_ids[v]
+        for head in iter_bits(grammar.terminal_heads.get(label, 0)):
+            result.add((u * k + head) * n + v)
 
-    queue = list(result.copy())
+    incoming = [set() for _ in range(n)]
+    outgoing = [set() for _ in range(n)]
+    for fact in result:
+        left, v = divmod(fact, n)
+        u, var = divmod(left, k)
+        incoming[v].add(left)
+        outgoing[u].add(var * n + v)
 
+    queue = list(result)
     while len(queue) > 0:
-        u, var, v = queue.pop()
-        for u_res, var_res, v_res in result.copy():
-            if v_res == u:
-                for production in wcfg.productions:
-                    if production.body == [var_res, var]:
-                        p = (u_res, production.head, v)
-                        if p not in result:
-                            queue.append(p)
-                            result.add(p)
-            elif u_res == v:
-                for production in wcfg.productions:
-                    if production.body == [var, var_res]:
-                        p = (u, production.head, v_res)
-                        if p not in result:
-                            queue.append(p)
-                            result.add(p)
+        left, v = divmod(queue.pop(), n)
+        u, var = divmod(left, k)
 
-    return result
+        new_facts = []
+        for left_part in incoming[u]:
+            u_left, var_left = divmod(left_part, k)
+            for head in pair_heads.get(var_left * k + var, ()):
+                new_facts.append((u_left, head, v))
+        for right_part in outgoing[v]:
+            var_right, v_right = divmod(right_part, n)
+            for head in pair_heads.get(var * k + var_right, ()):
+                new_facts.append((u, head, v_right))
+
+        for u_new, head, v_new in new_facts:
+            fact = (u_new * k + head) * n + v_new
+            if fact not in result:
+                result.add(fact)
+                incoming[v_new].add(u_new * k + head)
+                outgoing[u_new].add(head * n + v_new)
+                queue.append(fact)
+
+    triples = set()
+    for fact in result:
+        left, v = divmod(fact, n)
+        u, var = divmod(left, k)
+        triples.add((nodes[u], grammar.variables[var], nodes[v]))
+    return triples
+
+
+def demand_driven(
+    cfg: CFG, graph: MultiDiGraph, start_nodes=None, symbol=Variable("S")
+):
+    """
+    Goal-directed variant of the Hellings algorithm (magic sets): a fact (u, A, v) is derived
+    only if the pair (u, A) is demanded by the query, i.e. u is a start node and A is the symbol,
+    or some demanded (w, B) with a production B -> A C or B -> C A needs it.
+    Only vertices reachable from start nodes are explored
+    :param cfg: the context-free grammar to query the graph
+    :param graph: to analyze
+    :param start_nodes: start vertices, all vertices of the graph if None or empty
+    :param symbol: the variable to find paths for
+    :return: set of tuples (start node, variable of the cfg, achievable node) of all demanded pairs,
+    it contains every fact of the Hellings algorithm for start nodes and the symbol
+    """
+    grammar = get_compiled_grammar(cfg)
+    if symbol not in grammar.variable_ids:
+        return set()
+
+    # vertices get ids when they are reached, out_edges[u] is read from the graph
+    # when u is demanded first and holds pairs (v, bitset of variables A with A -> label)
+    nodes, node_ids, out_edges = [], {}, {}
+    k = len(grammar.variables)
+
+    def node_id(node):
+        if node not in node_ids:
+            node_ids[node] = len(nodes)
+            nodes.append(node)
+        return node_ids[node]
+
+    def edges_of(u):
+        if u not in out_edges:
+            out_edges[u] = []
+            for _, v, label in graph.out_edges(nodes[u], data="label"):
+                heads = grammar.terminal_heads.get(label, 0)
+                if heads:
+                    out_edges[u].append((node_id(v), heads))
+        return out_edges[u]
+
+    bodies = [[] for _ in range(k)]
+    for pair, heads in grammar.pair_heads.items():
+        for head in heads:
+            bodies[head].append(divmod(pair, k))
+    nullable = set(grammar.nullable_heads)
+
+    # pairs (u, A) are encoded as u * k + A, answers[u * k + A] is the set of v with (u, A, v),
+    # after (u, B, w) with A -> B C the pair (w, C) is demanded and waits[w * k + C] gets u * k + A,
+    # continuations[u * k + B] holds (A, C) of all such productions of demanded (u, A)
+    answers, continuations, waits = {}, defaultdict(list), defaultdict(list)
+    stack = []
 
+    def demand(pair):
+        if pair not in answers:
+            answers[pair] = set()
+            stack.append((pair, None))
 
-def matrix_mult(cfg: CFG, graph: MultiDiGraph):
+    def add_fact(pair, v):
+        if v not in answers[pair]:
+            answers[pair].add(v)
+            stack.append((pair, v))
+
+    def wait(pair, w, right):
+        needed = w * k + right
+        demand(needed)
+        waits[needed].append(pair)
+        for v in list(answers[needed]):
+            add_fact(pair, v)
+
+    if not start_nodes:
+        start_nodes = graph.nodes
+    var = grammar.variable_ids[symbol]
+    for node in start_nodes:
+        if node in graph:
+            demand(node_id(node) * k + var)
+
+    while len(stack) > 0:
+        pair, v = stack.pop()
+        u, var = divmod(pair, k)
+        if v is None:
+            if var in nullable:
+                add_fact(pair, u)
+            for w, heads in edges_of(u):
+                if heads >> var & 1:
+                    add_fact(pair, w)
+            for left, right in bodies[var]:
+                left_pair = u * k + left
+                demand(left_pair)
+                continuations[left_pair].append((var, right))
+                for w in list(answers[left_pair]):
+                    wait(pair, w, right)
+        else:
+            for head, right in list(continuations[pair]):
+                wait(u * k + head, v, right)
+            for waiting in list(waits[pair]):
+                add_fact(waiting, v)
+
+    triples = set()
+    for pair, reachable in answers.items():
+        u, var = divmod(pair, k)
+        triples.update((nodes[u], grammar.variables[var], nodes[v]) for v in reachable)
+    return triples
+
+
+def matrix_mult(cfg: CFG, graph: MultiDiGraph, executor=None):
     """
     Implementation of the Matrix Algorithm for Solving Reachability Problems with CS Constraints
     :param cfg: the context-free grammar to query the graph
     :param graph: to analyze
+    :param executor: concurrent.futures.Executor to compute products of productions in parallel,
+    then every iteration uses matrices of the previous one
     :return: set of tuples (start node, variable of the cfg, achievable node)
     """
-    wcfg = cfg_to_wсnf(cfg)
+    return _matrices_to_triples(*_matrix_mult_matrices(cfg, graph, executor))
 
-    nodes = list(graph.nodes)
-    n = len(nodes)
-    matrices = {var: dok_matrix((n, n), dtype=np.bool_) for var in wcfg.variables}
-
-    var_productions = {}
-    for production in wcfg.productions:
-        if len(production.body) == 0:
-            for i in range(n):
-                matrices[production.head][i, i] = True
-        elif len(production.body) == 1:
-            for u, v, label in graph.edges(data="label"):
-                i = nodes.index(u)
-                j = nodes.index(v)
-                if Variable(label) == production.body[0]:
-                    matrices[production.head][i, j] = True
-        elif len(production.body) == 2:
-            var1 = Variable(production.body[0].value)
-            var2 = Variable(production.body[1].value)
-            if (var1, var2) not in var_productions:
-                var_productions[(var1, var2)] = set()
-            var_productions[(var1, var2)].add(production.head)
+
+def _matrix_mult_matrices(cfg: CFG, graph: MultiDiGraph, executor=None):
+    grammar = get_compiled_grammar(cfg)
+    nodes, matrices, var_productions = _init_matrices(grammar, graph)
 
     matrices_changed = True
     while matrices_changed:
         matrices_changed = False
-        for production in wcfg.productions:
-            if len(production.body) != 2:
+        if executor is None:
+            products = (
+                matrices[var1] @ matrices[var2] for var1, var2 in var_productions
+            )
+        else:
+            products = map_products(
+                [matrices[var1] for var1, _ in var_productions],
+                [matrices[var2] for _, var2 in var_productions],
+                executor,
+            )
+        for heads, product in zip(var_productions.values(), products):
+            for head in heads:
+                nnz = matrices[head].nnz
+                matrices[head] = matrices[head] + product
+                matrices_changed |= matrices[head].nnz != nnz
+
+    return nodes, _variable_matrices(grammar, matrices)
+
+
+def matrix_semi_naive(cfg: CFG, graph: MultiDiGraph, executor=None):
+    """
+    Semi-naive variant of the matrix algorithm: every iteration multiplies only
+    the entries derived on the previous one, i.e. computes dB @ C + B @ dC
+    :param cfg: the context-free grammar to query the graph
+    :param graph: to analyze
+    :param executor: concurrent.futures.Executor to compute products of productions in parallel
+    :return: set of tuples (start node, variable of the cfg, achievable node)
+    """
+    return _matrices_to_triples(*_semi_naive_matrices(cfg, graph, executor))
+
+
+def _semi_naive_matrices(cfg: CFG, graph: MultiDiGraph, executor=None):
+    grammar = get_compiled_grammar(cfg)
+    nodes, matrices, var_productions = _init_matrices(grammar, graph)
+
+    n = len(nodes)
+    empty = csr_matrix((n, n), dtype=np.bool_)
+    deltas = dict(matrices)
+    while any(delta.nnz > 0 for delta in deltas.values()):
+        lefts, rights, active = [], [], []
+        for (var1, var2), heads in var_productions.items():
+            delta1, delta2 = deltas.get(var1, empty), deltas.get(var2, empty)
+            if delta1.nnz == 0 and delta2.nnz == 0:
                 continue
-            else:
-                var1 = Variable(production.body[0].value)
-                var2 = Variable(production.body[1].value)
-                for i in range(n):
-                    for j in range(n):
-                        for k in range(n):
-                            if (
-                                matrices[var1][i, j]
-                                and matrices[var2][j, k]
-                                and not matrices[production.head][i, k]
-                            ):
-                                matrices[production.head][i, k] = True
-                                matrices_changed = True
+            lefts += [delta1, matrices[var1]]
+            rights += [matrices[var2], delta2]
+            active.append(heads)
+
+        products = map_products(lefts, rights, executor)
+        derived = {}
+        for index, heads in enumerate(active):
+            product = products[2 * index] + products[2 * index + 1]
+            for head in heads:
+                derived[head] = derived[head] + product if head in derived else product
+
+        deltas = {}
+        for head, matrix in derived.items():
+            delta = matrix > matrices[head]
+            if delta.nnz > 0:
+                matrices[head] = matrices[head] + delta
+                deltas[head] = delta
+
+    return nodes, _variable_matrices(grammar, matrices)
+
+
+def tensor(cfg: CFG, graph: MultiDiGraph):
+    """
+    Implementation of the tensor algorithm: the recursive state machine of the grammar
+    is repeatedly intersected with the graph, every path from a start to a final state
+    of the box for A found in the transitive closure becomes a new edge A in the graph
+    :param cfg: the context-free grammar to query the graph
+    :param graph: to analyze
+    :return: set of tuples (start node, variable of the cfg, achievable node)
+    """
+    return _matrices_to_triples(*_tensor_matrices(cfg, graph))
+
+
+def _tensor_matrices(cfg: CFG, graph: MultiDiGraph):
+    rsm = RSM.ecfg_to_rsm(ECFG.from_CFG(cfg)).minimize()
+    rsm_matrices = rsm.to_bool_matrices_union()
+    graph_matrices = BoolMatrices.from_graph(graph)
+
+    n, k = graph_matrices.count_of_states, rsm_matrices.count_of_states
+    nodes = [state.value for state in graph_matrices.indexed_states()]
+
+    boxes = list(rsm.boxes.keys())
+    box_of_state = np.full(k, -1)
+    is_start, is_final = np.zeros(k, dtype=np.bool_), np.zeros(k, dtype=np.bool_)
+    for state, index in rsm_matrices.states_indices.items():
+        box_of_state[index] = boxes.index(state.value[0])
+        is_start[index] = state in rsm_matrices.start_states
+        is_final[index] = state in rsm_matrices.final_states
+
+    graph_bool_matrices = {
+        label: to_sparse(matrix)
+        for label, matrix in graph_matrices.bool_matrices.items()
+    }
+    var_matrices = {var: csr_matrix((n, n), dtype=np.bool_) for var in boxes}
+    for index in np.flatnonzero(is_start & is_final):
+        var_matrices[boxes[box_of_state[index]]] = identity(
+            n, dtype=np.bool_, format="csr"
+        )
+
+    def label_matrix(label):
+        var = Variable(label.value)
+        if var in var_matrices:
+            return var_matrices[var]
+        return graph_bool_matrices.get(label)
+
+    def kron_edges(labels):
+        edges = csr_matrix((k * n, k * n), dtype=np.bool_)
+        for label in labels:
+            matrix = label_matrix(label)
+            if matrix is not None and matrix.nnz > 0:
+                edges = edges + kron(
+                    rsm_matrices.bool_matrices[label], matrix, format="csr"
+                )
+        return edges
+
+    start_rows = (np.flatnonzero(is_start)[:, None] * n + np.arange(n)).ravel()
+    final_cols = (np.flatnonzero(is_final)[:, None] * n + np.arange(n)).ravel()
+
+    closure = BoolMatrices.update_transitive_closure(
+        csr_matrix((k * n, k * n), dtype=np.bool_),
+        kron_edges(rsm_matrices.bool_matrices.keys()),
+    )
+    while True:
+        rows, cols = closure[start_rows][:, final_cols].nonzero()
+        rows, cols = start_rows[rows], final_cols[cols]
+        from_box, to_box = box_of_state[rows // n], box_of_state[cols // n]
+
+        changed = []
+        for box_index in np.unique(from_box[from_box == to_box]):
+            mask = (from_box == box_index) & (to_box == box_index)
+            var = boxes[box_index]
+            found = csr_matrix(
+                (np.ones(mask.sum(), dtype=np.bool_), (rows[mask] % n, cols[mask] % n)),
+                shape=(n, n),
+                dtype=np.bool_,
+            )
+            delta = found > var_matrices[var]
+            if delta.nnz > 0:
+                var_matrices[var] = var_matrices[var] + delta
+                changed.append((var, delta))
+
+        if len(changed) == 0:
+            break
+
+        delta_edges = csr_matrix((k * n, k * n), dtype=np.bool_)
+        for var, delta in changed:
+            label = Symbol(var.value)
+            if label in rsm_matrices.bool_matrices:
+                delta_edges = delta_edges + kron(
+                    rsm_matrices.bool_matrices[label], delta, format="csr"
+                )
+        closure = BoolMatrices.update_transitive_closure(closure, delta_edges)
+
+    return nodes, var_matrices
+
+
+def _init_matrices(grammar: CompiledGrammar, graph: MultiDiGraph):
+    """
+    Build the initial boolean matrix of every variable of the grammar in weak CNF
+    :param grammar: the context-free grammar in weak CNF with integer ids of variables
+    :param graph: to analyze
+    :return: list of nodes, dict {id of variable: csr matrix},
+    dict {(ids of body variables): ids of heads}
+    """
+    nodes = list(graph.nodes)
+    n = len(nodes)
+    node_indices = {node: index for index, node in enumerate(nodes)}
+
+    label_edges = {}
+    for u, v, label in graph.edges(data="label"):
+        rows, cols = label_edges.setdefault(label, ([], []))
+        rows.append(node_indices[u])
+        cols.append(node_indices[v])
+
+    k = len(grammar.variables)
+    var_indices = [([], []) for _ in range(k)]
+    for head in grammar.nullable_heads:
+        rows, cols = var_indices[head]
+        rows.extend(range(n))
+        cols.extend(range(n))
+    for terminal, heads in grammar.terminal_heads.items():
+        label_rows, label_cols = label_edges.get(terminal, ([], []))
+        for head in iter_bits(heads):
+            rows, cols = var_indices[head]
+            rows.extend(label_rows)
+            cols.extend(label_cols)
+
+    matrices = {
+        var: csr_matrix(
+            (np.ones(len(rows), dtype=np.bool_), (rows, cols)),
+            shape=(n, n),
+            dtype=np.bool_,
+        )
+        for var, (rows, cols) in enumerate(var_indices)
+    }
+    var_productions = {
+        divmod(pair, k): heads for pair, heads in grammar.pair_heads.items()
+    }
+
+    return nodes, matrices, var_productions
+
+
+def _variable_matrices(grammar: CompiledGrammar, matrices: dict) -> dict:
+    return {grammar.variables[var]: matrix for var, matrix in matrices.items()}
+
+
+def _matrices_to_triples(nodes: list, matrices: dict):
     result = set()
-    for var in wcfg.variables:
-        rows, cols = matrices[var].nonzero()
-        for i in range(len(rows)):
-            result.add((nodes[rows[i]], var, nodes[cols[i]]))
+    for var, matrix in matrices.items():
+        rows, cols = matrix.nonzero()
+        for i, j in zip(rows, cols):
+            result.add((nodes[i], var, nodes[j]))
     return result
 
 
 class cfpqAlgo(Enum):
     HELLINGS = hellings
     MATRIX = matrix_mult
+    SEMI_NAIVE = matrix_semi_naive
+    TENSOR = tensor
+    DEMAND = demand_driven
+
+
+_MATRIX_ENGINES = {
+    matrix_mult: _matrix_mult_matrices,
+    matrix_semi_naive: _semi_naive_matrices,
+    tensor: _tensor_matrices,
+}
 
 
 def algo_from_text(cfg: str, graph: MultiDiGraph, algo: cfpqAlgo = cfpqAlgo.HELLINGS):
@@ -143,18 +471,129 @@ def cfpq(
     """
     if not start_nodes:
         start_nodes = set(graph.nodes)
-    if not final_nodes:
-        final_nodes = set(graph.nodes)
 
-    result_hellings = algo(cfg, graph)
     result = {u: set() for u in start_nodes}
-    for u, var, v in result_hellings:
-        if var == symbol and u in start_nodes and v in final_nodes:
-            result[u].add(v)
+    for u, v in iter_cfpq(cfg, graph, start_nodes, final_nodes, symbol, algo):
+        result[u].add(v)
 
     return result
 
 
+def cfpq_matrix(
+    cfg: CFG,
+    graph: MultiDiGraph,
+    start_nodes=None,
+    final_nodes=None,
+    symbol=Variable("S"),
+    algo: cfpqAlgo = cfpqAlgo.HELLINGS,
+):
+    """
+    The same as cfpq, but the result is not converted to python objects.
+    Matrix algorithms return their matrix for the symbol without building triples.
+    :param cfg: the context-free grammer
+    :param graph: the graph to analyze
+    :param start_nodes: start vertices
+    :param final_nodes: final vertices
+    :param symbol: any nonterminal
+    :param algo: algorithm for find cfpq
+    :return: pair (csr matrix, nodes), entry (i, j) of the matrix is True if nodes[j] is
+    reachable from nodes[i] and they are start and final vertices respectively,
+    for the demand driven algorithm nodes are only start and reached vertices
+    """
+    if algo in _MATRIX_ENGINES:
+        nodes, matrices = _MATRIX_ENGINES[algo](cfg, graph)
+        matrix = matrices.get(
+            symbol, csr_matrix((len(nodes), len(nodes)), dtype=np.bool_)
+        )
+    elif algo is demand_driven:
+        return _demand_driven_matrix(cfg, graph, start_nodes, final_nodes, symbol)
+    else:
+        nodes = list(graph.nodes)
+        node_indices = {node: index for index, node in enumerate(nodes)}
+        rows, cols = [], []
+        for u, var, v in algo(cfg, graph):
+            if var == symbol:
+                rows.append(node_indices[u])
+                cols.append(node_indices[v])
+        matrix = csr_matrix(
+            (np.ones(len(rows), dtype=np.bool_), (rows, cols)),
+            shape=(len(nodes), len(nodes)),
+            dtype=np.bool_,
+        )
+
+    node_indices = {node: index for index, node in enumerate(nodes)}
+    masks = []
+    for selected in (start_nodes, final_nodes):
+        mask = np.ones(len(nodes), dtype=np.bool_)
+        if selected:
+            mask[:] = False
+            mask[
+                [node_indices[node] for node in selected if node in node_indices]
+            ] = True
+        masks.append(diags(mask, dtype=np.bool_, format="csr"))
+
+    return masks[0] @ csr_matrix(matrix) @ masks[1], to_index_array(nodes)
+
+
+def _demand_driven_matrix(
+    cfg: CFG, graph: MultiDiGraph, start_nodes, final_nodes, symbol: Variable
+):
+    # only start vertices and vertices of found pairs are indexed, the graph is not scanned
+    nodes, node_indices = [], {}
+
+    def index_of(node):
+        if node not in node_indices:
+            node_indices[node] = len(nodes)
+            nodes.append(node)
+        return node_indices[node]
+
+    starts = set(start_nodes) if start_nodes else None
+    finals = set(final_nodes) if final_nodes else None
+    for node in starts or ():
+        if node in graph:
+            index_of(node)
+
+    rows, cols = [], []
+    for u, var, v in demand_driven(cfg, graph, start_nodes, symbol):
+        if var != symbol or (starts is not None and u not in starts):
+            continue
+        if finals is None or v in finals:
+            rows.append(index_of(u))
+            cols.append(index_of(v))
+
+    matrix = csr_matrix(
+        (np.ones(len(rows), dtype=np.bool_), (rows, cols)),
+        shape=(len(nodes), len(nodes)),
+        dtype=np.bool_,
+    )
+    return matrix, to_index_array(nodes)
+
+
+def iter_cfpq(
+    cfg: CFG,
+    graph: MultiDiGraph,
+    start_nodes=None,
+    final_nodes=None,
+    symbol=Variable("S"),
+    algo: cfpqAlgo = cfpqAlgo.HELLINGS,
+    block_size: int = 4096,
+):
+    """
+    The same as cfpq, but pairs (start node, reachable node) are yielded by blocks of start nodes
+    :param cfg: the context-free grammer
+    :param graph: the graph to analyze
+    :param start_nodes: start vertices
+    :param final_nodes: final vertices
+    :param symbol: any nonterminal
+    :param algo: algorithm for find cfpq
+    :param block_size: number of start nodes in one block
+    :return: generator of pairs (start node, reachable node)
+    """
+    matrix, nodes = cfpq_matrix(cfg, graph, start_nodes, final_nodes, symbol, algo)
+    for rows, cols in iter_nonzero_blocks(matrix, block_size):
+        yield from zip(nodes[rows].tolist(), nodes[cols].tolist())
+
+
 def cfpq_from_text(
     cfg: str,
     graph: MultiDiGraph,
@@ -0,0 +1,238 @@
+from collections import Counter, defaultdict
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG, Variable
+from scipy.sparse import csr_matrix
+
+from project.bool_matrices import to_index_array
+from project.cfg_utils import get_compiled_grammar, iter_bits
+from project.cfpq import _MATRIX_ENGINES, cfpqAlgo, hellings
+
+
+class CFPQIndex:
+    """
+    Maintained result of a context-free path query: facts (u, A, v) for all variables
+    of the grammar in weak CNF over a changing graph.
+    Facts are kept as successor and predecessor sets of every variable, so inserted edges
+    are propagated fact by fact and deleted edges are handled by the DRed algorithm
+    (delete and rederive), parallel edges are counted
+    """
+
+    def __init__(
+        self, cfg: CFG, graph: MultiDiGraph, algo: cfpqAlgo = cfpqAlgo.HELLINGS
+    ):
+        """
+        :param cfg: the context-free grammar
+        :param graph: initial graph, it is not modified by the index
+        :param algo: algorithm to build the index: HELLINGS, MATRIX or SEMI_NAIVE
+        """
+        self.grammar = get_compiled_grammar(cfg)
+        k = len(self.grammar.variables)
+        # for every A -> B C: bodies[A] holds (B, C), left_rules[B] holds (A, C)
+        # and right_rules[C] holds (A, B)
+        self.bodies = [[] for _ in range(k)]
+        self.left_rules = [[] for _ in range(k)]
+        self.right_rules = [[] for _ in range(k)]
+        for pair, heads in self.grammar.pair_heads.items():
+            left, right = divmod(pair, k)
+            for head in heads:
+                self.bodies[head].append((left, right))
+                self.left_rules[left].append((head, right))
+                self.right_rules[right].append((head, left))
+
+        self.nodes = list(graph.nodes)
+        self.node_ids = {node: index for index, node in enumerate(self.nodes)}
+        self.edge_labels = {}
+        for u, v, label in graph.edges(data="label"):
+            key = (self.node_ids[u], self.node_ids[v])
+            self.edge_labels.setdefault(key, Counter())[label] += 1
+
+        self.successors = [defaultdict(set) for _ in range(k)]
+        self.predecessors = [defaultdict(set) for _ in range(k)]
+        if algo is hellings:
+            for u, var, v in hellings(cfg, graph):
+                self._insert(
+                    self.node_ids[u], self.grammar.variable_ids[var], self.node_ids[v]
+                )
+        elif algo in (cfpqAlgo.MATRIX, cfpqAlgo.SEMI_NAIVE):
+            _, matrices = _MATRIX_ENGINES[algo](cfg, graph)
+            for var, matrix in matrices.items():
+                var = self.grammar.variable_ids[var]
+                for u, v in zip(*matrix.nonzero()):
+                    self._insert(int(u), var, int(v))
+        else:
+            raise ValueError(f"{algo} can not build CFPQIndex")
+
+    def add_edges(self, edges):
+        """
+        Insert edges and derive all new facts from them
+        :param edges: iterable of tuples (u, v, label), unknown vertices are added
+        """
+        facts = []
+        for u, v, label in edges:
+            for node in (u, v):
+                if node not in self.node_ids:
+                    self.node_ids[node] = len(self.nodes)
+                    self.nodes.append(node)
+                    node = self.node_ids[node]
+                    facts += [(node, var, node) for var in self.grammar.nullable_heads]
+
+            key = (self.node_ids[u], self.node_ids[v])
+            labels = self.edge_labels.setdefault(key, Counter())
+            labels[label] += 1
+            if labels[label] == 1:
+                facts += self._terminal_facts(key, label)
+
+        self._propagate([fact for fact in facts if self._insert(*fact)])
+
+    def remove_edges(self, edges):
+        """
+        Delete edges: every fact which may depend on them is deleted,
+        then facts with another derivation are restored and propagated
+        :param edges: iterable of tuples (u, v, label), one edge is removed per tuple
+        """
+        removed = Counter()
+        for u, v, label in edges:
+            if u not in self.node_ids or v not in self.node_ids:
+                raise ValueError(f"Edge {(u, v, label)} is not in the index")
+            removed[(self.node_ids[u], self.node_ids[v], label)] += 1
+        for (u, v, label), count in removed.items():
+            if self.edge_labels.get((u, v), Counter())[label] < count:
+                raise ValueError(
+                    f"Edge {(self.nodes[u], self.nodes[v], label)} is not in the index"
+                )
+
+        facts = []
+        for (u, v, label), count in removed.items():
+            labels = self.edge_labels[(u, v)]
+            labels[label] -= count
+            if labels[label] == 0:
+                del labels[label]
+                facts += self._terminal_facts((u, v), label)
+            if len(labels) == 0:
+                del self.edge_labels[(u, v)]
+
+        deleted = self._over_delete(facts)
+        for u, var, v in deleted:
+            self.successors[var][u].discard(v)
+            self.predecessors[var][v].discard(u)
+
+        rederived = [fact for fact in deleted if self._is_derivable(*fact)]
+        self._propagate([fact for fact in rederived if self._insert(*fact)])
+
+    def query(self, start_nodes=None, final_nodes=None, symbol=Variable("S")):
+        """
+        :param start_nodes: start vertices, all vertices if None or empty
+        :param final_nodes: final vertices, all vertices if None or empty
+        :param symbol: any nonterminal
+        :return: dict { start_node: set of reachable final nodes}
+        """
+        if not start_nodes:
+            start_nodes = self.nodes
+        result = {u: set() for u in start_nodes}
+        var = self.grammar.variable_ids.get(symbol)
+        if var is None:
+            return result
+
+        finals = None
+        if final_nodes:
+            finals = {self.node_ids[v] for v in final_nodes if v in self.node_ids}
+        for u in result:
+            if u not in self.node_ids:
+                continue
+            reachable = self.successors[var].get(self.node_ids[u], ())
+            if finals is not None:
+                reachable = finals.intersection(reachable)
+            result[u] = {self.nodes[v] for v in reachable}
+        return result
+
+    def query_matrix(self, symbol=Variable("S")):
+        """
+        :param symbol: any nonterminal
+        :return: pair (csr matrix, nodes), entry (i, j) of the matrix is True
+        if nodes[j] is reachable from nodes[i]
+        """
+        n = len(self.nodes)
+        rows, cols = [], []
+        var = self.grammar.variable_ids.get(symbol)
+        if var is not None:
+            for u, reachable in self.successors[var].items():
+                rows += [u] * len(reachable)
+                cols += reachable
+        matrix = csr_matrix(
+            (np.ones(len(rows), dtype=np.bool_), (rows, cols)),
+            shape=(n, n),
+            dtype=np.bool_,
+        )
+        return matrix, to_index_array(self.nodes)
+
+    def _insert(self, u: int, var: int, v: int) -> bool:
+        if v in self.successors[var][u]:
+            return False
+        self.successors[var][u].add(v)
+        self.predecessors[var][v].add(u)
+        return True
+
+    def _contains(self, u: int, var: int, v: int) -> bool:
+        return u in self.successors[var] and v in self.successors[var][u]
+
+    def _terminal_facts(self, key, label):
+        u, v = key
+        return [
+            (u, var, v) for var in iter_bits(self.grammar.terminal_heads.get(label, 0))
+        ]
+
+    def _consequences(self, u: int, var: int, v: int):
+        """
+        :return: generator of facts derived in one step from the fact and known facts
+        """
+        for head, right in self.left_rules[var]:
+            for w in list(self.successors[right].get(v, ())):
+                yield u, head, w
+        for head, left in self.right_rules[var]:
+            for w in list(self.predecessors[left].get(u, ())):
+                yield w, head, v
+
+    def _propagate(self, stack: list):
+        """
+        Insert all consequences of the facts, which are already inserted
+        :param stack: list of new facts, it is consumed
+        """
+        while len(stack) > 0:
+            for fact in self._consequences(*stack.pop()):
+                if self._insert(*fact):
+                    stack.append(fact)
+
+    def _over_delete(self, facts: list) -> set:
+        """
+        :param facts: facts which lost their terminal derivation
+        :return: the facts which are known and every known fact which has
+        a derivation using them
+        """
+        stack = [fact for fact in facts if self._contains(*fact)]
+        deleted = set(stack)
+        while len(stack) > 0:
+            for fact in self._consequences(*stack.pop()):
+                if fact not in deleted and self._contains(*fact):
+                    deleted.add(fact)
+                    stack.append(fact)
+        return deleted
+
+    def _is_derivable(self, u: int, var: int, v: int) -> bool:
+        """
+        :return: True if the fact is derived in one step from the remaining facts and edges
+        """
+        if u == v and var in self.grammar.nullable_heads:
+            return True
+        if any(
+            self.grammar.terminal_heads.get(label, 0) >> var & 1
+            for label in self.edge_labels.get((u, v), ())
+        ):
+            return True
+        return any(
+            not self.successors[left]
+            .get(u, set())
+            .isdisjoint(self.predecessors[right].get(v, ()))
+            for left, right in self.bodies[var]
+        )
@@ -0,0 +1,157 @@
+from collections import defaultdict
+
+import numpy as np
+from pyformlang.cfg import CFG
+
+from project.bit_matrix import WORD_SIZE
+from project.cfg_utils import cfg_from_file, get_cnf
+
+CHUNK_SIZE = 4096
+
+
+class CYKRecognizer:
+    """
+    CYK membership check for one grammar in Chomsky normal form.
+    A cell of the table is a bitset of variables packed into uint64 words, all cells
+    of one span length of a chunk of words with the same length are filled
+    by bitwise operations at once
+    """
+
+    def __init__(self, cfg: CFG):
+        """
+        :param cfg: the context-free grammar, it is converted to Chomsky normal form
+        """
+        cnf = get_cnf(cfg)
+        self.generates_epsilon = cnf.generates_epsilon
+        variables = sorted(cnf.cfg.variables, key=lambda variable: str(variable.value))
+        variable_ids = {variable: index for index, variable in enumerate(variables)}
+        self.count_of_variables = k = len(variables)
+        self.words_per_cell = max(-(-k // WORD_SIZE), 1)
+        self.start = variable_ids.get(cnf.cfg.start_symbol)
+
+        # terminal_words[terminal_ids[a]] is the bitset of heads of A -> a
+        self.terminal_ids = {}
+        terminal_heads = []
+        pair_heads = defaultdict(list)
+        for production in cnf.cfg.productions:
+            head = variable_ids[production.head]
+            if len(production.body) == 1:
+                terminal = production.body[0].value
+                if terminal not in self.terminal_ids:
+                    self.terminal_ids[terminal] = len(terminal_heads)
+                    terminal_heads.append([])
+                terminal_heads[self.terminal_ids[terminal]].append(head)
+            else:
+                left, right = (variable_ids[var] for var in production.body)
+                pair_heads[(left, right)].append(head)
+
+        self.terminal_words = np.zeros(
+            (len(terminal_heads), self.words_per_cell), dtype=np.uint64
+        )
+        for index, heads in enumerate(terminal_heads):
+            self.terminal_words[index] = self._bitset(heads)
+        self.pairs = [
+            (left, right, self._bitset(heads))
+            for (left, right), heads in sorted(pair_heads.items())
+        ]
+
+    @staticmethod
+    def from_file(filename: str) -> "CYKRecognizer":
+        """
+        :param filename: file with the grammar in the text format of pyformlang
+        :return: recognizer of the grammar
+        """
+        return CYKRecognizer(cfg_from_file(filename))
+
+    def accepts(self, word) -> bool:
+        """
+        :param word: string of one-character terminals or sequence of terminals
+        :return: True if the word is derived in the grammar
+        """
+        return bool(self.accepts_many([word])[0])
+
+    def accepts_many(self, words, chunk_size: int = CHUNK_SIZE) -> np.ndarray:
+        """
+        Check many words, words of the same length are checked together by chunks
+        :param words: iterable of words, see accepts
+        :param chunk_size: maximal number of words in one table, it bounds the memory
+        :return: boolean array with the result for every word
+        """
+        words = [list(word) for word in words]
+        result = np.zeros(len(words), dtype=bool)
+        groups = defaultdict(list)
+        for index, word in enumerate(words):
+            if all(token in self.terminal_ids for token in word):
+                groups[len(word)].append(index)
+
+        for length, indices in groups.items():
+            if length == 0:
+                result[indices] = self.generates_epsilon
+                continue
+            if self.start is None:
+                continue
+            for begin in range(0, len(indices), chunk_size):
+                chunk = indices[begin : begin + chunk_size]
+                tokens = np.array(
+                    [[self.terminal_ids[token] for token in words[i]] for i in chunk]
+                )
+                cell = self._fill(self.terminal_words[tokens])
+                word, bit = divmod(self.start, WORD_SIZE)
+                result[chunk] = (cell[:, word] >> np.uint64(bit)) & np.uint64(1) > 0
+        return result
+
+    def _bitset(self, variables) -> np.ndarray:
+        bitset = np.zeros(self.words_per_cell, dtype=np.uint64)
+        for var in variables:
+            word, bit = divmod(var, WORD_SIZE)
+            bitset[word] |= np.uint64(1) << np.uint64(bit)
+        return bitset
+
+    def _fill(self, first: np.ndarray) -> np.ndarray:
+        """
+        :param first: array (words, length, words per cell) of cells of spans of length 1
+        :return: array (words, words per cell) of cells of the whole words
+        """
+        n = first.shape[1]
+        # table[length] has shape (words, n - length + 1, words per cell), every layer
+        # is read by splits of all longer spans
+        table = [None, first]
+        for length in range(2, n + 1):
+            m = n - length + 1
+            cells = np.zeros((first.shape[0], m, self.words_per_cell), dtype=np.uint64)
+            for p in range(1, length):
+                left, right = table[p][:, :m], table[length - p][:, p : p + m]
+                left_bits, right_bits = {}, {}
+                for var1, var2, heads in self.pairs:
+                    if var1 not in left_bits:
+                        left_bits[var1] = _variable_bits(left, var1)
+                    if var2 not in right_bits:
+                        right_bits[var2] = _variable_bits(right, var2)
+                    found = left_bits[var1] & right_bits[var2]
+                    if found.any():
+                        cells[found] |= heads
+            table.append(cells)
+        return table[n][:, 0]
+
+
+def _variable_bits(cells: np.ndarray, var: int) -> np.ndarray:
+    word, bit = divmod(var, WORD_SIZE)
+    return (cells[..., word] >> np.uint64(bit)) & np.uint64(1) > 0
+
+
+def cyk(cfg: CFG, word) -> bool:
+    """
+    :param cfg: the context-free grammar
+    :param word: string of one-character terminals or sequence of terminals
+    :return: True if the word is derived in the grammar
+    """
+    return CYKRecognizer(cfg).accepts(word)
+
+
+def cyk_from_file(filename: str, word) -> bool:
+    """
+    :param filename: file with the grammar in the text format of pyformlang
+    :param word: string of one-character terminals or sequence of terminals
+    :return: True if the word is derived in the grammar
+    """
+    return cyk(cfg_from_file(filename), word)
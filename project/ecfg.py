@@ -55,7 +55,7 @@ class ECFG:
             regex = Regex(
                 ".".join(variable.value for variable in production.body)
                 if len(production.body) > 0
-                else ""
+                else "$"
             )
             productions[production.head] = (
                 regex
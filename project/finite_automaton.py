@@ -2,6 +2,8 @@ from pyformlang.regular_expression import Regex
 from pyformlang.finite_automaton import (
     DeterministicFiniteAutomaton,
     NondeterministicFiniteAutomaton,
+    State,
+    Symbol,
 )
 import networkx as nx
 
@@ -48,3 +50,68 @@ def graph_to_nfa(
     )
 
     return nfa_from_graph
+
+
+# States and symbols of pyformlang cache the hash of their value when they are created.
+# The hash of a string differs between processes, so a state or a symbol unpickled
+# in another process is not found in sets and dicts which contain an equal one.
+# Automata and labels are written to files and sent to workers as plain values
+# and their states and symbols are created anew by the reader.
+
+
+def to_values(objects) -> list:
+    """
+    :param objects: iterable of states or symbols
+    :return: list of their values, they can be pickled and sent to another process
+    """
+    return [obj.value for obj in objects]
+
+
+def states_from_values(values) -> list:
+    """
+    :param values: values of states, see to_values
+    :return: list of states created in this process
+    """
+    return [State(value) for value in values]
+
+
+def symbols_from_values(values) -> list:
+    """
+    :param values: values of symbols, see to_values
+    :return: list of symbols created in this process
+    """
+    return [Symbol(value) for value in values]
+
+
+def dfa_to_values(dfa: DeterministicFiniteAutomaton) -> tuple:
+    """
+    :param dfa: deterministic finite automaton
+    :return: tuple (states, start states, final states, transitions) of plain values,
+    transitions are triples (source, symbol, target)
+    """
+    return (
+        to_values(dfa.states),
+        to_values(dfa.start_states),
+        to_values(dfa.final_states),
+        [
+            (source.value, symbol.value, target.value)
+            for source, transitions in dfa.to_dict().items()
+            for symbol, target in transitions.items()
+        ],
+    )
+
+
+def dfa_from_values(values: tuple) -> DeterministicFiniteAutomaton:
+    """
+    :param values: tuple returned by dfa_to_values
+    :return: deterministic finite automaton with states and symbols created in this process
+    """
+    states, start_states, final_states, transitions = values
+    dfa = DeterministicFiniteAutomaton(states=set(states_from_values(states)))
+    for state in states_from_values(start_states):
+        dfa.add_start_state(state)
+    for state in states_from_values(final_states):
+        dfa.add_final_state(state)
+    for source, symbol, target in transitions:
+        dfa.add_transition(State(source), Symbol(symbol), State(target))
+    return dfa
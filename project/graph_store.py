@@ -0,0 +1,124 @@
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from project.bit_matrix import to_sparse
+from project.bool_matrices import BoolMatrices, VertexStatesIndices, to_index_array
+import project.finite_automaton as fa
+
+MAGIC = b"BMSTORE1"
+ALIGNMENT = 64
+
+
+def write_graph_store(bool_matrices: BoolMatrices, path):
+    """
+    Write boolean decomposition of a graph to one read-only file: a pickled header
+    followed by aligned csr arrays of labels and the array of vertices
+    :param bool_matrices: boolean decomposition, values of states are vertices of the graph
+    :param path: path to the file, it is replaced atomically
+    """
+    path = Path(path)
+    vertices = to_index_array(fa.to_values(bool_matrices.indexed_states()))
+    arrays = {}
+    labels = list(bool_matrices.bool_matrices.keys())
+    for index, label in enumerate(labels):
+        matrix = to_sparse(bool_matrices.bool_matrices[label])
+        for name in ("data", "indices", "indptr"):
+            arrays[f"{index}.{name}"] = getattr(matrix, name)
+
+    header = {
+        "labels": fa.to_values(labels),
+        "count_of_states": bool_matrices.count_of_states,
+        "start_states": _store_states(bool_matrices, bool_matrices.start_states),
+        "final_states": _store_states(bool_matrices, bool_matrices.final_states),
+    }
+    if vertices.dtype == object:
+        header["vertices"] = vertices.tolist()
+    else:
+        arrays["vertices"] = vertices
+
+    specs, offset = {}, 0
+    for name, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        specs[name] = (offset, array.dtype.str, array.shape)
+        offset += array.nbytes
+    header["arrays"] = specs
+
+    header_bytes = pickle.dumps(header)
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(data_start).tobytes())
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + specs[name][0])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    temporary.replace(path)
+
+
+def open_graph_store(path) -> BoolMatrices:
+    """
+    Open a file written by write_graph_store. Arrays are memory-mapped read-only,
+    so all processes which open the same file share one copy of the graph,
+    for numeric vertices no python object is created per vertex
+    :param path: path to the file
+    :return: boolean decomposition of the graph
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a graph store")
+        data_start = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header = pickle.load(f)
+
+    n = header["count_of_states"]
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, (offset, dtype, shape) in header["arrays"].items():
+        begin = data_start + offset
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        arrays[name] = buffer[begin : begin + size].view(dtype).reshape(shape)
+
+    result = BoolMatrices()
+    result.count_of_states = n
+    if "vertices" in arrays:
+        vertices = arrays["vertices"]
+        result.states_indices = VertexStatesIndices(vertices)
+        result.states = result.states_indices.keys()
+    else:
+        vertices = to_index_array(header["vertices"])
+        states = fa.states_from_values(header["vertices"])
+        result.states = set(states)
+        result.states_indices = {state: index for index, state in enumerate(states)}
+    result.start_states = _load_states(result, vertices, header["start_states"])
+    result.final_states = _load_states(result, vertices, header["final_states"])
+
+    for index, label in enumerate(fa.symbols_from_values(header["labels"])):
+        result.bool_matrices[label] = sparse.csr_matrix(
+            tuple(arrays[f"{index}.{name}"] for name in ("data", "indices", "indptr")),
+            shape=(n, n),
+            copy=False,
+        )
+
+    return result
+
+
+def _store_states(bool_matrices: BoolMatrices, states):
+    if states is bool_matrices.states:
+        return None
+    return [
+        bool_matrices.states_indices[state]
+        for state in states
+        if state in bool_matrices.states_indices
+    ]
+
+
+def _load_states(bool_matrices: BoolMatrices, vertices: np.ndarray, indices):
+    if indices is None:
+        return bool_matrices.states
+    return set(fa.states_from_values(vertices[indices].tolist()))
@@ -1,21 +1,180 @@
 import cfpq_data
+import hashlib
+import json
+import os
 from collections import namedtuple
+from pathlib import Path
 import networkx as nx
+import pandas as pd
 
-GraphInfo = namedtuple("GraphInfo", ["number_of_vertices", "number_of_edges", "labels"])
+from project.bool_matrices import BoolMatrices
+from project.graph_store import open_graph_store, write_graph_store
+
+GraphInfo = namedtuple(
+    "GraphInfo",
+    [
+        "number_of_vertices",
+        "number_of_edges",
+        "labels",
+        "label_counts",
+        "out_degree",
+        "in_degree",
+    ],
+)
+DegreeSummary = namedtuple("DegreeSummary", ["min", "max", "mean", "median"])
+
+GRAPH_CACHE_DIR = Path(
+    os.environ.get("GRAPH_CACHE_DIR", Path.home() / ".cache" / "formal-lang-graphs")
+)
 
 
 def get_graph_by_name(name: str) -> nx.MultiDiGraph:
-    graph_path = cfpq_data.download(name)
+    graph_path = graph_csv_path(name)
     graph = cfpq_data.graph_from_csv(graph_path)
 
     return graph
 
 
+def graph_csv_path(name: str) -> Path:
+    """
+    :param name: name of a graph from the dataset or path to a local CSV file
+    :return: path to the CSV file, the graph is downloaded only if there is no such local file
+    """
+    if os.path.isfile(name):
+        return Path(name)
+    return Path(cfpq_data.download(name))
+
+
+def get_graph_decomposition_by_name(name: str, cache_dir=None) -> BoolMatrices:
+    """
+    Boolean decomposition of a graph from the dataset or from a local CSV file.
+    It is built once and written to a graph store in the cache named by the hash
+    of the CSV file, later loads memory-map the store
+    :param name: name of a graph from the dataset or path to a local CSV file
+    :param cache_dir: cache directory, by default GRAPH_CACHE_DIR
+    :return: boolean decomposition of the graph, all vertices are start and final states
+    """
+    csv_path = graph_csv_path(name)
+    path = Path(cache_dir or GRAPH_CACHE_DIR) / f"{_file_hash(csv_path)}.store"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        edges = pd.read_csv(
+            csv_path,
+            sep=" ",
+            header=None,
+            names=["from", "to", "label"],
+            engine="c",
+        )
+        bool_matrices = BoolMatrices.from_edges(
+            edges["from"].to_numpy(), edges["label"].to_numpy(), edges["to"].to_numpy()
+        )
+        write_graph_store(bool_matrices, path)
+
+    return open_graph_store(path)
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def get_graph_info_by_name(name: str) -> GraphInfo:
-    graph = get_graph_by_name(name)
+    return get_graph_info_from_csv(graph_csv_path(name))
+
+
+def get_graph_info_from_csv(
+    path, chunk_size: int = 1 << 20, use_cache: bool = True
+) -> GraphInfo:
+    """
+    Statistics of a graph computed by one pass over its CSV file without building the graph,
+    only counters of vertices and labels are kept in memory besides one chunk of edges.
+    The result is cached in <path>.info.json and recomputed when size or modification time
+    of the file changes
+    :param path: path to the CSV file with lines "source target label"
+    :param chunk_size: number of edges read at once
+    :param use_cache: read and write the cached result
+    :return: number of vertices and edges, set of labels, number of edges by labels
+    and summaries of out and in degrees of vertices
+    """
+    path = Path(path)
+    cache_path = path.with_name(path.name + ".info.json")
+    stat = path.stat()
+    signature = [stat.st_size, stat.st_mtime_ns]
+    if use_cache and cache_path.exists():
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached["signature"] == signature:
+            return _graph_info_from_json(cached["info"])
+
+    out_degree, in_degree = pd.Series(dtype="int64"), pd.Series(dtype="int64")
+    label_counts = pd.Series(dtype="int64")
+    for edges in pd.read_csv(
+        path,
+        sep=" ",
+        header=None,
+        names=["from", "to", "label"],
+        engine="c",
+        chunksize=chunk_size,
+    ):
+        out_degree = out_degree.add(edges["from"].value_counts(), fill_value=0)
+        in_degree = in_degree.add(edges["to"].value_counts(), fill_value=0)
+        label_counts = label_counts.add(edges["label"].value_counts(), fill_value=0)
+
+    vertices = out_degree.index.union(in_degree.index)
+    info = GraphInfo(
+        len(vertices),
+        int(label_counts.sum()),
+        set(label_counts.index.tolist()),
+        {label: int(count) for label, count in label_counts.items()},
+        _degree_summary(out_degree.reindex(vertices, fill_value=0)),
+        _degree_summary(in_degree.reindex(vertices, fill_value=0)),
+    )
+
+    if use_cache:
+        try:
+            with open(cache_path, "w") as f:
+                json.dump(
+                    {"signature": signature, "info": _graph_info_to_json(info)}, f
+                )
+        except OSError:
+            # the directory of the dataset is read-only
+            pass
+    return info
+
+
+def _degree_summary(degrees: pd.Series) -> DegreeSummary:
+    if len(degrees) == 0:
+        return DegreeSummary(0, 0, 0.0, 0.0)
+    return DegreeSummary(
+        int(degrees.min()),
+        int(degrees.max()),
+        float(degrees.mean()),
+        float(degrees.median()),
+    )
+
+
+def _graph_info_to_json(info: GraphInfo) -> dict:
+    return {
+        "number_of_vertices": info.number_of_vertices,
+        "number_of_edges": info.number_of_edges,
+        "label_counts": list(info.label_counts.items()),
+        "out_degree": list(info.out_degree),
+        "in_degree": list(info.in_degree),
+    }
+
+
+def _graph_info_from_json(info: dict) -> GraphInfo:
+    label_counts = {label: count for label, count in info["label_counts"]}
     return GraphInfo(
-        graph.number_of_nodes(), graph.number_of_edges(), graph.edges(data=True)
+        info["number_of_vertices"],
+        info["number_of_edges"],
+        set(label_counts),
+        label_counts,
+        DegreeSummary(*info["out_degree"]),
+        DegreeSummary(*info["in_degree"]),
     )
 
 
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import pickle
+import re
+from collections import OrderedDict
+from pathlib import Path
+
+from pyformlang.finite_automaton import DeterministicFiniteAutomaton
+
+import project.finite_automaton as fa
+from project.bool_matrices import BoolMatrices
+
+
+class RegexCache:
+    """
+    LRU cache of minimal DFA of regular expressions and their boolean decompositions.
+    Cached values are shared between queries and must not be modified
+    """
+
+    def __init__(self, maxsize: int = 512, directory=None):
+        """
+        :param maxsize: maximal number of regular expressions kept in memory
+        :param directory: directory to persist compiled regular expressions across processes,
+        nothing is written to disk if None
+        """
+        self.maxsize = maxsize
+        self.directory = None if directory is None else Path(directory)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def canonicalize(regex: str) -> str:
+        """
+        Normalize whitespace of a regular expression: runs of whitespace are collapsed
+        and whitespace around operators and parentheses is removed
+        :param regex: academic regular expression in string representation
+        :return: regular expression with the same language
+        """
+        regex = re.sub(r"\s+", " ", regex.strip())
+        return re.sub(r"\s*([|+().*])\s*", r"\1", regex)
+
+    def get(self, regex: str):
+        """
+        :param regex: academic regular expression in string representation
+        :return: pair (minimal DFA, its boolean decomposition)
+        """
+        key = self.canonicalize(regex)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        entry = self._load(key)
+        if entry is None:
+            self.misses += 1
+            dfa = fa.regex_to_dfa(key)
+            entry = dfa, BoolMatrices(dfa)
+            self._save(key, entry)
+        else:
+            self.hits += 1
+
+        self._entries[key] = entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def dfa(self, regex: str) -> DeterministicFiniteAutomaton:
+        """
+        :param regex: academic regular expression in string representation
+        :return: minimal DFA of the regular expression
+        """
+        return self.get(regex)[0]
+
+    def bool_matrices(self, regex: str) -> BoolMatrices:
+        """
+        :param regex: academic regular expression in string representation
+        :return: boolean decomposition of the minimal DFA of the regular expression
+        """
+        return self.get(regex)[1]
+
+    def clear(self):
+        """
+        Remove all entries from memory and reset counters, files on disk are kept
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{hashlib.sha256(key.encode()).hexdigest()}.pickle"
+
+    def _load(self, key: str):
+        if self.directory is None or not self._path(key).exists():
+            return None
+        with open(self._path(key), "rb") as f:
+            stored_key, stored_dfa = pickle.load(f)
+        if stored_key != key:
+            return None
+        dfa = fa.dfa_from_values(stored_dfa)
+        return dfa, BoolMatrices(dfa)
+
+    def _save(self, key: str, entry):
+        if self.directory is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temporary, "wb") as f:
+            pickle.dump((key, fa.dfa_to_values(entry[0])), f)
+        temporary.replace(path)
+
+
+default_cache = RegexCache()
@@ -1,7 +1,24 @@
+import os
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
 import project.bool_matrices as bm
 import project.finite_automaton as fa
+import project.graph_store as graph_store
+import project.regex_cache as regex_cache
 from pyformlang.finite_automaton import NondeterministicFiniteAutomaton
 import networkx as nx
+import numpy as np
+from scipy import sparse
+
+# decomposition of the graph and of the regex loaded once by every worker process
+# of partitioned requests
+_partition_graph = None
+_partition_dfa = None
+
+BatchResult = namedtuple("BatchResult", ["results", "total_time", "time_per_query"])
 
 
 def regular_path_querying(
@@ -22,6 +39,7 @@ def regular_requests_to_graph(
     graph: nx.MultiDiGraph,
     start_states: set = None,
     final_states: set = None,
+    lazy: bool = False,
 ) -> set:
     """
     Given a graph with the given start and end vertices and a regular expression, returns those pairs of vertices
@@ -31,23 +49,223 @@ def regular_requests_to_graph(
     :param graph: the graph with field 'label' on edges for conversion to NFA
     :param start_states: iterable object with initial states, can be None
     :param final_states: iterable object with final states, can be None.
+    :param lazy: do not build matrices of the intersection of the graph and the regular expression
+    :return: pairs of vertices from given start and end vertices that are connected by a path that
+    forms a word from the language given by the regular expression.
+    """
+    return set(
+        iter_regular_requests_to_graph(
+            regex, graph, start_states, final_states, lazy=lazy
+        )
+    )
+
+
+def regular_requests_to_graph_matrix(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_states: set = None,
+    final_states: set = None,
+    lazy: bool = False,
+):
+    """
+    The same as regular_requests_to_graph, but the result is not converted to python objects.
+    :param regex: academic regular expression in string representation
+    :param graph: the graph with field 'label' on edges for conversion to NFA
+    :param start_states: iterable object with initial states, can be None
+    :param final_states: iterable object with final states, can be None.
+    :param lazy: do not build matrices of the intersection, only states reachable
+    from the start states are searched for
+    :return: pair (csr matrix, vertices), entry (i, j) of the matrix is True if vertices[j] is
+    reachable from vertices[i] by a path that forms a word from the language given by the regular expression.
+    """
+    bnfa = bm.BoolMatrices.from_graph(graph, start_states, final_states)
+    bdfa = regex_cache.default_cache.bool_matrices(regex)
+    n, k = bnfa.count_of_states, bdfa.count_of_states
+    vertices = bm.to_index_array([state.value for state in bnfa.indexed_states()])
+
+    bintersect = bnfa.intersect(bdfa, lazy)
+    if len(bintersect.bool_matrices) == 0:
+        return sparse.csr_matrix((n, n), dtype=bool), vertices
+
+    starts = np.flatnonzero(np.kron(bnfa.start_indicator(), bdfa.start_indicator()))
+    finals = np.flatnonzero(np.kron(bnfa.final_indicator(), bdfa.final_indicator()))
+    if lazy:
+        rows, cols = bintersect.get_reachability(starts)[:, finals].nonzero()
+    else:
+        tc = sparse.csr_matrix(bintersect.get_transitive_closure())
+        rows, cols = tc[starts][:, finals].nonzero()
+
+    result = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=bool), (starts[rows] // k, finals[cols] // k)),
+        shape=(n, n),
+        dtype=bool,
+    )
+    return result, vertices
+
+
+def iter_regular_requests_to_graph(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_states: set = None,
+    final_states: set = None,
+    block_size: int = 4096,
+    lazy: bool = False,
+):
+    """
+    The same as regular_requests_to_graph, but pairs of vertices are yielded by blocks of start vertices
+    :param regex: academic regular expression in string representation
+    :param graph: the graph with field 'label' on edges for conversion to NFA
+    :param start_states: iterable object with initial states, can be None
+    :param final_states: iterable object with final states, can be None.
+    :param block_size: number of start vertices in one block
+    :param lazy: do not build matrices of the intersection of the graph and the regular expression
+    :return: generator of pairs of vertices
+    """
+    matrix, vertices = regular_requests_to_graph_matrix(
+        regex, graph, start_states, final_states, lazy
+    )
+    for rows, cols in bm.iter_nonzero_blocks(matrix, block_size):
+        yield from zip(vertices[rows].tolist(), vertices[cols].tolist())
+
+
+def partitioned_requests_to_graph(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_states: set = None,
+    final_states: set = None,
+    processes: int = None,
+    shards: int = None,
+) -> set:
+    """
+    The same as regular_requests_to_graph, but start vertices are split into shards
+    which are searched by multi-source BFS in a pool of processes
+    :param regex: academic regular expression in string representation
+    :param graph: the graph with field 'label' on edges for conversion to NFA
+    :param start_states: iterable object with initial states, can be None
+    :param final_states: iterable object with final states, can be None.
+    :param processes: number of worker processes, by default number of processors
+    :param shards: number of shards of start vertices, by default 4 per process
     :return: pairs of vertices from given start and end vertices that are connected by a path that
     forms a word from the language given by the regular expression.
     """
-    nfa = fa.graph_to_nfa(graph, start_states, final_states)
-    dfa = fa.regex_to_dfa(regex)
+    matrix, vertices = partitioned_requests_to_graph_matrix(
+        regex, graph, start_states, final_states, processes, shards
+    )
+    rows, cols = matrix.nonzero()
+    return set(zip(vertices[rows].tolist(), vertices[cols].tolist()))
+
+
+def partitioned_requests_to_graph_matrix(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_states: set = None,
+    final_states: set = None,
+    processes: int = None,
+    shards: int = None,
+):
+    """
+    The same as partitioned_requests_to_graph, but the result is not converted to python objects.
+    The decomposition of the graph is written to a temporary graph store once and memory-mapped
+    by the workers, only indices of start vertices are sent with every shard
+    :param regex: academic regular expression in string representation
+    :param graph: the graph with field 'label' on edges for conversion to NFA
+    :param start_states: iterable object with initial states, can be None
+    :param final_states: iterable object with final states, can be None.
+    :param processes: number of worker processes, by default number of processors
+    :param shards: number of shards of start vertices, by default 4 per process
+    :return: pair (csr matrix, vertices) as in regular_requests_to_graph_matrix
+    """
+    bnfa = bm.BoolMatrices.from_graph(graph, start_states, final_states)
+    n = bnfa.count_of_states
+    vertices = bm.to_index_array([state.value for state in bnfa.indexed_states()])
+    starts = np.flatnonzero(bnfa.start_indicator())
 
-    bnfa, bdfa = bm.BoolMatrices(nfa), bm.BoolMatrices(dfa)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if shards is None:
+        shards = 4 * processes
+    parts = [part for part in np.array_split(starts, shards) if len(part) > 0]
 
-    bintersect = bnfa.intersect(bdfa)
-    tc = bintersect.get_transitive_closure()
+    rows, cols = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)]
+    if len(parts) > 0:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "graph")
+            graph_store.write_graph_store(bnfa, path)
+            dfa = fa.dfa_to_values(regex_cache.default_cache.dfa(regex))
+            with ProcessPoolExecutor(
+                processes, initializer=_load_partition, initargs=(path, dfa)
+            ) as executor:
+                for part_rows, part_cols in executor.map(_search_partition, parts):
+                    rows.append(part_rows)
+                    cols.append(part_cols)
 
-    result = set()
-    for s1, s2 in zip(*tc.nonzero()):
-        if s1 in bintersect.start_states and s2 in bintersect.final_states:
-            result.add((s1 // bdfa.count_of_states, s2 // bdfa.count_of_states))
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    result = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(n, n), dtype=bool
+    )
+    return result, vertices
 
-    return result
+
+def _load_partition(path, dfa: tuple):
+    global _partition_graph, _partition_dfa
+    _partition_graph = graph_store.open_graph_store(path)
+    _partition_dfa = bm.BoolMatrices(fa.dfa_from_values(dfa))
+
+
+def _search_partition(starts: np.ndarray):
+    reachable, starts = _partition_graph.reachability_bfs_matrix(_partition_dfa, starts)
+    rows, cols = reachable.nonzero()
+    return starts[rows], cols
+
+
+def batch_requests_to_graph(
+    regexes: list,
+    graph: nx.MultiDiGraph,
+    start_states: set = None,
+    final_states: set = None,
+) -> BatchResult:
+    """
+    Evaluate many regular expressions on one graph. The graph is decomposed once,
+    minimal DFA of the requests are joined into one automaton whose final states
+    are tagged by the number of their request, and one multi-source BFS advances
+    the front of all requests together
+    :param regexes: list of academic regular expressions in string representation
+    :param graph: the graph with field 'label' on edges for conversion to NFA
+    :param start_states: iterable object with initial states, can be None
+    :param final_states: iterable object with final states, can be None.
+    :return: BatchResult(list of sets of pairs of vertices as in regular_requests_to_graph
+    in the order of regexes, total time in seconds, amortised time of one request)
+    """
+    begin = time.perf_counter()
+    bnfa = bm.BoolMatrices.from_graph(graph, start_states, final_states)
+    vertices = bm.to_index_array([state.value for state in bnfa.indexed_states()])
+    bdfas = [regex_cache.default_cache.bool_matrices(regex) for regex in regexes]
+    union = bm.BoolMatrices.disjoint_union(bdfas)
+    k = union.count_of_states
+
+    owners = np.repeat(
+        np.arange(len(bdfas)), [bdfa.count_of_states for bdfa in bdfas]
+    ).astype(int)
+    visited, starts = bnfa.reachability_bfs_states(union)
+    rows, cols = visited.nonzero()
+    mask = union.final_indicator()[rows % k] & bnfa.final_indicator()[cols]
+    rows, cols = rows[mask], cols[mask]
+    queries = owners[rows % k]
+
+    results = [set() for _ in regexes]
+    order = np.argsort(queries, kind="stable")
+    bounds = np.searchsorted(queries[order], np.arange(len(regexes) + 1))
+    for index, result in enumerate(results):
+        part = order[bounds[index] : bounds[index + 1]]
+        result.update(
+            zip(
+                vertices[starts[rows[part] // k]].tolist(),
+                vertices[cols[part]].tolist(),
+            )
+        )
+
+    total_time = time.perf_counter() - begin
+    return BatchResult(results, total_time, total_time / max(len(regexes), 1))
 
 
 def bfs_requests_to_graph(
@@ -66,9 +284,90 @@ def bfs_requests_to_graph(
     :param final_states: iterable object with final states, can be None.
     :return: set of reachable vertices
     """
-    nfa = fa.graph_to_nfa(graph, start_states, final_states)
-    dfa = fa.regex_to_dfa(regex)
+    bnfa = bm.BoolMatrices.from_graph(graph, start_states, final_states)
+    bdfa = regex_cache.default_cache.bool_matrices(regex)
+
+    states = bnfa.indexed_states()
+    result = bnfa.bfs_based_rpq(bdfa, separated)
+    if separated:
+        return {(states[u].value, states[v].value) for u, v in result}
+    return {states[v].value for v in result}
 
-    bnfa, bdfa = bm.BoolMatrices(nfa), bm.BoolMatrices(dfa)
 
-    return bnfa.bfs_based_rpq(bdfa, separated)
+def reachability_requests_to_graph(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    separated: bool,
+    start_states: set = None,
+    final_states: set = None,
+):
+    """
+    Searches for reachability with regular constraints for several starting vertices,
+    unlike bfs_requests_to_graph the direct sum of the graph and the request is not built,
+    so memory is linear in the number of reached (start vertex, request state, vertex) triples.
+    :param regex: academic regular expression in string representation
+    :param graph: the graph with field 'label' on edges for conversion to NFA
+    :param separated: type of task
+    :param start_states: iterable object with initial states, can be None
+    :param final_states: iterable object with final states, can be None.
+    :return: set of reachable vertices or set of pairs (start vertex, reachable vertex)
+    """
+    return set(
+        iter_reachability_requests_to_graph(
+            regex, graph, separated, start_states, final_states
+        )
+    )
+
+
+def reachability_requests_to_graph_matrix(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    start_states: set = None,
+    final_states: set = None,
+):
+    """
+    The same as reachability_requests_to_graph, but the result is not converted to python objects.
+    :param regex: academic regular expression in string representation
+    :param graph: the graph with field 'label' on edges for conversion to NFA
+    :param start_states: iterable object with initial states, can be None
+    :param final_states: iterable object with final states, can be None.
+    :return: triple (csr matrix, start vertices, vertices), entry (i, j) of the matrix is True
+    if vertices[j] is reachable from start_vertices[i]
+    """
+    bnfa = bm.BoolMatrices.from_graph(graph, start_states, final_states)
+    bdfa = regex_cache.default_cache.bool_matrices(regex)
+    vertices = bm.to_index_array([state.value for state in bnfa.indexed_states()])
+
+    reachable, starts = bnfa.reachability_bfs_matrix(bdfa)
+    return reachable, vertices[starts], vertices
+
+
+def iter_reachability_requests_to_graph(
+    regex: str,
+    graph: nx.MultiDiGraph,
+    separated: bool,
+    start_states: set = None,
+    final_states: set = None,
+    block_size: int = 4096,
+):
+    """
+    The same as reachability_requests_to_graph, but the result is yielded by blocks of start vertices
+    or by blocks of reachable vertices if separated is False
+    :param regex: academic regular expression in string representation
+    :param graph: the graph with field 'label' on edges for conversion to NFA
+    :param separated: type of task
+    :param start_states: iterable object with initial states, can be None
+    :param final_states: iterable object with final states, can be None.
+    :param block_size: number of start vertices in one block
+    :return: generator of reachable vertices or pairs (start vertex, reachable vertex)
+    """
+    matrix, start_vertices, vertices = reachability_requests_to_graph_matrix(
+        regex, graph, start_states, final_states
+    )
+    if not separated:
+        matrix = sparse.csr_matrix(matrix.getnnz(axis=0) > 0).T
+    for rows, cols in bm.iter_nonzero_blocks(matrix, block_size):
+        if separated:
+            yield from zip(start_vertices[rows].tolist(), vertices[cols].tolist())
+        else:
+            yield from vertices[rows].tolist()
@@ -1,4 +1,5 @@
 import pyformlang.cfg
+from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, State
 from project.ecfg import ECFG
 from project.bool_matrices import BoolMatrices
 
@@ -28,6 +29,27 @@ class RSM:
 
         return matrices
 
+    def to_bool_matrices_union(self):
+        """
+        Build one boolean decomposition for all boxes of rsm,
+        states of the box for variable A are State((A, state))
+        :return: boolean decomposition of the union of boxes
+        """
+        nfa = NondeterministicFiniteAutomaton()
+        for variable, box in self.boxes.items():
+            for from_v, label, to_v in box:
+                nfa.add_transition(
+                    State((variable, from_v.value)),
+                    label,
+                    State((variable, to_v.value)),
+                )
+            for state in box.start_states:
+                nfa.add_start_state(State((variable, state.value)))
+            for state in box.final_states:
+                nfa.add_final_state(State((variable, state.value)))
+
+        return BoolMatrices(nfa)
+
     @staticmethod
     def ecfg_to_rsm(ecfg: ECFG):
         """
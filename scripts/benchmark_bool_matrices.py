@@ -0,0 +1,119 @@
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+import shared
+
+sys.path.insert(0, str(shared.ROOT))
+
+from pyformlang.finite_automaton import NondeterministicFiniteAutomaton  # noqa: E402
+from scipy import sparse  # noqa: E402
+
+from project.bool_matrices import BoolMatrices  # noqa: E402
+
+
+def random_nfa(
+    states: int, transitions: int, labels: int, seed: int = 42, starts: int = None
+):
+    generator = random.Random(seed)
+    nfa = NondeterministicFiniteAutomaton()
+    nfa.add_transitions(
+        (
+            generator.randrange(states),
+            f"l{generator.randrange(labels)}",
+            generator.randrange(states),
+        )
+        for _ in range(transitions)
+    )
+    for state in range(states):
+        if starts is None or state < starts:
+            nfa.add_start_state(state)
+        nfa.add_final_state(state)
+    return nfa
+
+
+def transform_rows_loop(self, part, other):
+    """
+    Front normalisation before it was vectorised, one python step per nonzero entry
+    """
+    transformed_part = sparse.lil_array(part.shape)
+
+    for i, j in zip(*part.nonzero()):
+        if j < other.count_of_states:
+            non_zero_right = part.getrow(i).tolil()[[0], other.count_of_states :]
+
+            if non_zero_right.nnz > 0:
+                shift_row = i // other.count_of_states * other.count_of_states
+                transformed_part[shift_row + j, j] = 1
+                transformed_part[
+                    [shift_row + j], other.count_of_states :
+                ] += non_zero_right
+
+    return transformed_part.tocsr()
+
+
+def measure_bfs(bm, dfa, separate, transform_rows):
+    vectorised = BoolMatrices._transform_rows
+    BoolMatrices._transform_rows = transform_rows
+    try:
+        begin = time.perf_counter()
+        result = bm.bfs_based_rpq(dfa, separate)
+        return result, time.perf_counter() - begin
+    finally:
+        BoolMatrices._transform_rows = vectorised
+
+
+def measure(build):
+    tracemalloc.start()
+    begin = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - begin
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BoolMatrices construction")
+    parser.add_argument("--states", type=int, default=20000)
+    parser.add_argument("--transitions", type=int, nargs="+", default=[100000])
+    parser.add_argument("--labels", type=int, default=8)
+    parser.add_argument("--starts", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'transitions':>12} {'time, s':>10} {'peak, MiB':>10} {'intersect, s':>13}")
+    for transitions in args.transitions:
+        nfa = random_nfa(args.states, transitions, args.labels)
+        bm, elapsed, peak = measure(lambda: BoolMatrices(nfa))
+
+        dfa = BoolMatrices(random_nfa(3, 3 * args.labels, args.labels))
+        begin = time.perf_counter()
+        bm.intersect(dfa)
+        intersect = time.perf_counter() - begin
+
+        print(
+            f"{transitions:>12} {elapsed:>10.3f} {peak / 2 ** 20:>10.1f} {intersect:>13.3f}"
+        )
+
+    print()
+    print(f"{'transitions':>12} {'separate':>9} {'loop, s':>10} {'vectorised, s':>14}")
+    for transitions in args.transitions:
+        bm = BoolMatrices(
+            random_nfa(args.states, transitions, args.labels, starts=args.starts)
+        )
+        dfa = BoolMatrices(random_nfa(3, 3 * args.labels, args.labels))
+        for separate in [False, True]:
+            expected, baseline = measure_bfs(bm, dfa, separate, transform_rows_loop)
+            result, elapsed = measure_bfs(
+                bm, dfa, separate, BoolMatrices._transform_rows
+            )
+            assert result == expected
+            print(
+                f"{transitions:>12} {separate!s:>9} {baseline:>10.3f} {elapsed:>14.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
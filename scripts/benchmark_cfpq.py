@@ -0,0 +1,76 @@
+import argparse
+import sys
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import shared
+
+sys.path.insert(0, str(shared.ROOT))
+
+from pyformlang.cfg import CFG  # noqa: E402
+
+from project import cfpq  # noqa: E402
+from project.graph_utils import create_labeled_two_cycles_graph  # noqa: E402
+
+GRAMMAR = CFG.from_text(
+    """
+S -> A B
+S -> A S1
+S1 -> S B
+A -> a
+B -> b
+"""
+)
+
+ALGORITHMS = {
+    "hellings": cfpq.cfpqAlgo.HELLINGS,
+    "matrix": cfpq.cfpqAlgo.MATRIX,
+    "semi_naive": cfpq.cfpqAlgo.SEMI_NAIVE,
+    "tensor": cfpq.cfpqAlgo.TENSOR,
+    "demand": cfpq.cfpqAlgo.DEMAND,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="CFPQ algorithms on labeled two cycles graphs"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--algo", choices=ALGORITHMS, nargs="+", default=ALGORITHMS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="threads for products of the matrix engines, sequential if 0",
+    )
+    parser.add_argument(
+        "--sources",
+        type=int,
+        default=1,
+        help="number of start nodes of the demand driven algorithm",
+    )
+    args = parser.parse_args()
+    executor = ThreadPoolExecutor(args.workers) if args.workers > 0 else None
+
+    print(f"{'algo':>10} {'n':>6} {'m':>6} {'facts':>10} {'time, s':>10}")
+    for size in args.sizes:
+        graph = create_labeled_two_cycles_graph(size, size - 1)
+        for name in args.algo:
+            algo = ALGORITHMS[name]
+            if executor is not None and name in ("matrix", "semi_naive"):
+                algo = partial(algo, executor=executor)
+            if name == "demand":
+                algo = partial(algo, start_nodes=list(graph.nodes)[: args.sources])
+            facts = len(algo(GRAMMAR, graph))
+            time = min(
+                timeit.repeat(
+                    lambda: algo(GRAMMAR, graph), number=1, repeat=args.repeat
+                )
+            )
+            print(f"{name:>10} {size:>6} {size - 1:>6} {facts:>10} {time:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import argparse
+import random
+import sys
+import timeit
+
+import shared
+
+sys.path.insert(0, str(shared.ROOT))
+
+from pyformlang.cfg import CFG  # noqa: E402
+
+from project.cyk import CYKRecognizer  # noqa: E402
+
+GRAMMAR = CFG.from_text("S -> a S b S | epsilon")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CYK on random words")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 20, 40])
+    parser.add_argument("--words", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    generator = random.Random(42)
+    recognizer = CYKRecognizer(GRAMMAR)
+    print(f"{'length':>8} {'words':>8} {'accepted':>10} {'per word, us':>13}")
+    for length in args.lengths:
+        words = [
+            "".join(generator.choice("ab") for _ in range(length))
+            for _ in range(args.words)
+        ]
+        accepted = int(recognizer.accepts_many(words).sum())
+        time = min(
+            timeit.repeat(
+                lambda: recognizer.accepts_many(words), number=1, repeat=args.repeat
+            )
+        )
+        print(
+            f"{length:>8} {args.words:>8} {accepted:>10} {time / args.words * 1e6:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
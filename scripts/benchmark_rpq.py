@@ -0,0 +1,102 @@
+import argparse
+import random
+import sys
+import timeit
+
+import shared
+
+sys.path.insert(0, str(shared.ROOT))
+
+from networkx import MultiDiGraph  # noqa: E402
+
+from project import regular_request as rr  # noqa: E402
+
+
+def random_graph(n: int, m: int, labels=("a", "b", "c"), seed: int = 42):
+    generator = random.Random(seed)
+    graph = MultiDiGraph()
+    graph.add_nodes_from(range(n))
+    graph.add_edges_from(
+        (
+            generator.randrange(n),
+            generator.randrange(n),
+            {"label": generator.choice(labels)},
+        )
+        for _ in range(m)
+    )
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RPQ algorithms on random graphs")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--degree", type=float, default=2.0)
+    parser.add_argument("--starts", type=int, default=10)
+    parser.add_argument("--regex", default="a* (b | c)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--processes", type=int, default=None, help="workers of partitioned query"
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=0,
+        help="number of regexes evaluated one by one and by one batch",
+    )
+    args = parser.parse_args()
+    labels = ["a", "b", "c"]
+    regexes = [
+        f"{labels[i % 3]}* {labels[(i + 1) % 3]} ({labels[(i + 2) % 3]} | {labels[i % 3]})"
+        + " a" * (i // 3 % 4)
+        for i in range(args.batch)
+    ]
+
+    print(f"{'query':>12} {'nodes':>8} {'edges':>8} {'result':>8} {'time, s':>10}")
+    for n in args.nodes:
+        graph = random_graph(n, int(n * args.degree))
+        starts = set(range(args.starts))
+        queries = {
+            "bfs": lambda: rr.bfs_requests_to_graph(args.regex, graph, False, starts),
+            "bfs_sep": lambda: rr.bfs_requests_to_graph(
+                args.regex, graph, True, starts
+            ),
+            "reach": lambda: rr.reachability_requests_to_graph(
+                args.regex, graph, False, starts
+            ),
+            "reach_sep": lambda: rr.reachability_requests_to_graph(
+                args.regex, graph, True, starts
+            ),
+            "closure": lambda: rr.regular_requests_to_graph(args.regex, graph, starts),
+            "lazy": lambda: rr.regular_requests_to_graph(
+                args.regex, graph, starts, lazy=True
+            ),
+            "partitioned": lambda: rr.partitioned_requests_to_graph(
+                args.regex, graph, starts, processes=args.processes
+            ),
+        }
+        for name, query in queries.items():
+            size = len(query())
+            time = min(timeit.repeat(query, number=1, repeat=args.repeat))
+            print(
+                f"{name:>12} {n:>8} {graph.number_of_edges():>8} {size:>8} {time:>10.4f}"
+            )
+
+        if len(regexes) > 0:
+            begin = timeit.default_timer()
+            size = sum(
+                len(rr.reachability_requests_to_graph(regex, graph, True, starts))
+                for regex in regexes
+            )
+            time = (timeit.default_timer() - begin) / len(regexes)
+            print(
+                f"{'one_by_one':>12} {n:>8} {graph.number_of_edges():>8} {size:>8} {time:>10.4f}"
+            )
+            batch = rr.batch_requests_to_graph(regexes, graph, starts)
+            size = sum(len(result) for result in batch.results)
+            print(
+                f"{'batch':>12} {n:>8} {graph.number_of_edges():>8} {size:>8} {batch.time_per_query:>10.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import numpy as np
+from scipy import sparse
+
+import project.bit_matrix as bit_matrix
+from project.bit_matrix import PackedBitMatrix, to_backend, union
+
+
+def random_matrix(rows, cols, density, seed):
+    return sparse.random(rows, cols, density=density, random_state=seed) > 0
+
+
+def test_conversions():
+    matrix = random_matrix(50, 130, 0.1, 1)
+    packed = PackedBitMatrix.from_sparse(matrix)
+    assert packed.nnz == matrix.nnz
+    assert (packed.tocsr() != matrix).nnz == 0
+    assert np.array_equal(
+        PackedBitMatrix.from_dense(matrix.toarray()).words, packed.words
+    )
+    assert (packed.T.tocsr() != matrix.T).nnz == 0
+
+
+def test_products():
+    for density in [0.05, 0.5]:
+        first = random_matrix(40, 70, density, 2)
+        second = random_matrix(70, 65, 0.1, 3)
+        expected = (first @ second) > 0
+        packed_first = PackedBitMatrix.from_sparse(first)
+        packed_second = PackedBitMatrix.from_sparse(second)
+
+        for product in [
+            packed_first @ packed_second,
+            first @ packed_second,
+            packed_first @ second,
+        ]:
+            assert isinstance(product, PackedBitMatrix)
+            assert (product.tocsr() != expected).nnz == 0
+
+
+def test_word_wise_transpose_and_nonzero(monkeypatch):
+    # blocks of 64 rows, the last one is not full
+    monkeypatch.setattr(bit_matrix, "CHUNK_WORDS", 64 * 130)
+    matrix = random_matrix(200, 130, 0.2, 6)
+    packed = PackedBitMatrix.from_sparse(matrix)
+    assert packed._rows_per_block() == 64
+
+    assert np.array_equal(packed.T.toarray(), matrix.toarray().T)
+    assert np.array_equal(packed.T.T.words, packed.words)
+    rows, cols = packed.nonzero()
+    expected_rows, expected_cols = matrix.nonzero()
+    order = np.lexsort((expected_cols, expected_rows))
+    assert np.array_equal(rows, expected_rows[order])
+    assert np.array_equal(cols, expected_cols[order])
+    assert PackedBitMatrix.zeros((0, 70)).T.shape == (70, 0)
+
+
+def test_backend_selection():
+    sparse_matrix = random_matrix(150, 150, 0.01, 4)
+    dense_matrix = random_matrix(150, 150, 0.3, 5)
+    assert not isinstance(to_backend(sparse_matrix, 0.1), PackedBitMatrix)
+    assert isinstance(to_backend(dense_matrix, 0.1), PackedBitMatrix)
+    assert not isinstance(to_backend(dense_matrix[:100, :100], 0.1), PackedBitMatrix)
+
+    result = union([to_backend(dense_matrix, 0.1), sparse_matrix], (150, 150))
+    assert (result.tocsr() != (dense_matrix + sparse_matrix)).nnz == 0
+    assert union([], (3, 3)).dtype == bool
@@ -0,0 +1,237 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from networkx import MultiDiGraph, isolates
+
+from pyformlang.finite_automaton import State, Symbol
+
+from project.bit_matrix import PackedBitMatrix, to_sparse
+from project.bool_matrices import (
+    BoolMatrices,
+    KroneckerProduct,
+    count_of_workers,
+    multiply_by_row_blocks,
+)
+import project.finite_automaton as fa
+
+
+def random_graph(n, m, labels=("a", "b"), seed=42):
+    generator = np.random.default_rng(seed)
+    graph = MultiDiGraph()
+    graph.add_nodes_from(range(n))
+    for _ in range(m):
+        u, v = generator.integers(n, size=2)
+        graph.add_edge(int(u), int(v), label=labels[generator.integers(len(labels))])
+    return graph
+
+
+def test_transitive_closure_variants():
+    # big enough to pack labels with the zero threshold
+    bm = BoolMatrices(fa.graph_to_nfa(random_graph(130, 170)))
+    squared = bm.get_transitive_closure(squaring=True)
+    by_adjacency = bm.get_transitive_closure(squaring=False)
+    assert (squared != by_adjacency).nnz == 0
+
+    for threshold in [0.0, 0.02, 1.0]:
+        for squaring in [None, True, False]:
+            closure = bm.get_transitive_closure(squaring, threshold)
+            assert closure.dtype == bool
+            assert (closure != squared).nnz == 0
+
+
+def test_closure_switches_to_adjacency(monkeypatch):
+    # sparse cycle with a tail, its closure is packed after a few squarings
+    graph = MultiDiGraph()
+    graph.add_edges_from((u, (u + 1) % 200, {"label": "a"}) for u in range(200))
+    graph.add_edges_from((u, u + 1, {"label": "b"}) for u in range(200, 259))
+    graph.add_edge(259, 0, label="a")
+    bm = BoolMatrices.from_graph(graph)
+    expected = bm.get_transitive_closure(squaring=True, density_threshold=1.0)
+    assert expected.nnz == 200 * 200 + 60 * 200 + 59 * 60 // 2
+
+    calls = []
+    extend = BoolMatrices._extend_by_adjacency
+
+    def spy(*args, **kwargs):
+        calls.append(args[0].nnz)
+        return extend(*args, **kwargs)
+
+    monkeypatch.setattr(BoolMatrices, "_extend_by_adjacency", staticmethod(spy))
+    closure = bm.get_transitive_closure()
+    assert (closure != expected).nnz == 0
+    assert len(calls) == 1 and 0 < calls[0] < expected.nnz
+
+
+def test_update_transitive_closure():
+    graph = random_graph(30, 40)
+    bm = BoolMatrices(fa.graph_to_nfa(graph))
+    closure = bm.get_transitive_closure()
+
+    n = bm.count_of_states
+    edges = sparse.csr_matrix(
+        (np.ones(3, dtype=bool), ([0, 5, 17], [9, 5, 2])), shape=(n, n)
+    )
+    adjacency = sparse.csr_matrix(sum(bm.bool_matrices.values()), dtype=bool) + edges
+    bm.bool_matrices["c"] = edges
+    expected = bm.get_transitive_closure()
+
+    updated = BoolMatrices.update_transitive_closure(closure, edges)
+    assert (updated != expected).nnz == 0
+
+    updated = BoolMatrices.update_transitive_closure(closure, edges, adjacency)
+    assert (updated != expected).nnz == 0
+
+
+def test_from_graph():
+    graph = random_graph(30, 60, labels=("a", "b", "c"))
+    graph.remove_nodes_from(list(isolates(graph)))
+    expected = BoolMatrices(fa.graph_to_nfa(graph))
+    sources, targets, labels = zip(*graph.edges(data="label"))
+
+    for bm in [
+        BoolMatrices.from_graph(graph),
+        BoolMatrices.from_graph((sources, labels, targets)),
+    ]:
+        assert bm.count_of_states == expected.count_of_states
+        assert bm.start_states == expected.start_states
+        assert bm.final_states == expected.final_states
+        assert bm.bool_matrices.keys() == expected.bool_matrices.keys()
+
+        order = [bm.states_indices[state] for state in expected.indexed_states()]
+        for label, matrix in expected.bool_matrices.items():
+            permuted = to_sparse(bm.bool_matrices[label])[order][:, order]
+            assert (permuted != matrix).nnz == 0
+
+    bm = BoolMatrices.from_graph(graph, {0, 1}, {2})
+    assert bm.start_states == {State(0), State(1)}
+    assert bm.final_states == {State(2)}
+
+
+def test_from_edges_with_string_nodes():
+    bm = BoolMatrices.from_edges(["x", "y", "x"], ["a", "b", "b"], ["y", "z", "z"])
+    assert bm.count_of_states == 3
+    assert {label.value for label in bm.bool_matrices} == {"a", "b"}
+    x, z = bm.states_indices[State("x")], bm.states_indices[State("z")]
+    assert to_sparse(bm.bool_matrices[Symbol("b")])[x, z]
+
+
+def test_intersect_states():
+    first = BoolMatrices(fa.regex_to_dfa("a b* c"))
+    second = BoolMatrices(fa.regex_to_dfa("a (b | c)*"))
+    k = second.count_of_states
+    intersection = first.intersect(second)
+
+    assert intersection.count_of_states == first.count_of_states * k
+    assert len(intersection.states_indices) == intersection.count_of_states
+    assert intersection.states_indices[k + 1] == k + 1
+    assert intersection.states_indices.split(k + 1) == (1, 1)
+    assert -1 not in intersection.states_indices
+
+    expected_start, expected_final = set(), set()
+    for s1, i in first.states_indices.items():
+        for s2, j in second.states_indices.items():
+            if s1 in first.start_states and s2 in second.start_states:
+                expected_start.add(i * k + j)
+            if s1 in first.final_states and s2 in second.final_states:
+                expected_final.add(i * k + j)
+    assert intersection.start_states == expected_start
+    assert intersection.final_states == expected_final
+
+
+def test_kronecker_product():
+    first = sparse.random(6, 5, density=0.3, random_state=1, format="csr") > 0
+    second = sparse.random(3, 4, density=0.4, random_state=2, format="csr") > 0
+    lazy = KroneckerProduct(first, second)
+    expected = sparse.kron(first, second, format="csr")
+    assert lazy.shape == expected.shape
+    assert (lazy.tocsr() != expected).nnz == 0
+
+    left = sparse.random(7, 18, density=0.3, random_state=3, format="csr") > 0
+    right = sparse.random(20, 2, density=0.3, random_state=4, format="csr") > 0
+    assert ((left @ lazy) != (left @ expected > 0)).nnz == 0
+    assert ((lazy @ right) != (expected @ right > 0)).nnz == 0
+
+    vector = np.arange(20) % 3 == 0
+    assert np.array_equal(lazy @ vector, expected @ vector > 0)
+
+
+def test_lazy_intersect_closure():
+    graph = BoolMatrices.from_graph(random_graph(30, 60))
+    regex = BoolMatrices(fa.regex_to_dfa("a* b (a | b)"))
+    lazy = graph.intersect(regex, lazy=True)
+    assert lazy.is_lazy()
+    assert not graph.intersect(regex).is_lazy()
+
+    expected = graph.intersect(regex).get_transitive_closure()
+    assert (lazy.get_transitive_closure() != expected).nnz == 0
+
+    sources = [0, 4, 9]
+    assert (lazy.get_reachability(sources) != expected[sources]).nnz == 0
+
+
+def test_executor(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: None)
+    graph = BoolMatrices.from_graph(random_graph(30, 40))
+    regex = BoolMatrices(fa.regex_to_dfa("a* b"))
+    expected = graph.get_transitive_closure()
+
+    assert count_of_workers() == 1
+    with ThreadPoolExecutor(4) as executor:
+        assert count_of_workers(executor) == 4
+        adjacency = to_sparse(graph.bool_matrices[Symbol("a")])
+        product = multiply_by_row_blocks(adjacency, adjacency, executor, 7)
+        assert (product != adjacency @ adjacency).nnz == 0
+        for squaring in [True, False]:
+            closure = graph.get_transitive_closure(squaring, executor=executor)
+            assert (closure != expected).nnz == 0
+
+    with ProcessPoolExecutor(2) as executor:
+        for separate in [False, True]:
+            assert graph.bfs_based_rpq(
+                regex, separate, executor
+            ) == graph.bfs_based_rpq(regex, separate)
+
+
+def test_dense_labels_are_packed():
+    graph = MultiDiGraph()
+    graph.add_nodes_from(range(150))
+    graph.add_edges_from((u, (u * 7 + 3) % 150, {"label": "a"}) for u in range(150))
+    graph.add_edges_from(
+        (u, v, {"label": "b"})
+        for u in range(150)
+        for v in range(150)
+        if (u + v) % 3 == 0
+    )
+    packed = BoolMatrices.from_graph(graph, {0, 1})
+    sparse_only = BoolMatrices.from_graph(graph, {0, 1}, density_threshold=1.0)
+    assert isinstance(packed.bool_matrices[Symbol("b")], PackedBitMatrix)
+    assert isinstance(packed.bool_matrices[Symbol("a")], sparse.csr_matrix)
+    assert isinstance(sparse_only.bool_matrices[Symbol("b")], sparse.csr_matrix)
+
+    expected = sparse_only.get_transitive_closure()
+    for squaring in [True, False]:
+        assert (packed.get_transitive_closure(squaring) != expected).nnz == 0
+
+    dfa = BoolMatrices(fa.regex_to_dfa("a* b a"))
+    for separate in [False, True]:
+        assert packed.bfs_based_rpq(dfa, separate) == sparse_only.bfs_based_rpq(
+            dfa, separate
+        )
+        assert packed.reachability_bfs_rpq(
+            dfa, separate
+        ) == sparse_only.reachability_bfs_rpq(dfa, separate)
+    assert (
+        packed.get_reachability([0, 1]) != sparse_only.get_reachability([0, 1])
+    ).nnz == 0
+
+    intersection = packed.intersect(dfa, density_threshold=0.0)
+    assert all(
+        isinstance(matrix, PackedBitMatrix)
+        for matrix in intersection.bool_matrices.values()
+    )
+    assert (
+        intersection.get_transitive_closure()
+        != sparse_only.intersect(dfa).get_transitive_closure()
+    ).nnz == 0
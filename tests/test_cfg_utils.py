@@ -50,3 +50,75 @@ def test_cfg_from_file():
     assert cfg.terminals == {Terminal("a"), Terminal("b"), Terminal("w")}
     assert cfg.variables == {Variable("S"), Variable("A"), Variable("B"), Variable("W")}
     assert cfg.start_symbol == Variable("S")
+
+
+def test_get_weak_cnf():
+    text = """
+        S -> A S B | A B | epsilon
+        A -> a
+        B -> b
+        """
+    first = get_weak_cnf(CFG.from_text(dedent(text)))
+    second = get_weak_cnf(CFG.from_text(dedent(text)))
+    assert first is second
+    wcnf = cfg_to_wсnf(CFG.from_text(dedent(text)))
+    assert wcnf is not first.cfg
+    assert wcnf.productions == first.cfg.productions
+
+    # the copy is not shared with the memoized grammar
+    production = Production(Variable("S"), [Variable("S"), Variable("S")])
+    wcnf.productions.add(production)
+    assert production not in first.cfg.productions
+    assert production not in cfg_to_wсnf(CFG.from_text(dedent(text))).productions
+
+    assert first.epsilon_heads == {Variable("S")}
+    assert first.terminal_heads == {"a": {Variable("A")}, "b": {Variable("B")}}
+    for (left, right), heads in first.pair_heads.items():
+        for head in heads:
+            assert Production(head, [left, right]) in first.cfg.productions
+    assert sum(map(len, first.pair_heads.values())) == sum(
+        len(production.body) == 2 for production in first.cfg.productions
+    )
+
+
+def test_get_compiled_grammar():
+    cfg = CFG.from_text(
+        dedent(
+            """
+            S -> A S B | A B | epsilon
+            A -> a
+            B -> b
+            """
+        )
+    )
+    grammar = get_compiled_grammar(cfg)
+    wcnf = get_weak_cnf(cfg)
+    k = len(grammar.variables)
+    assert grammar.variables[grammar.variable_ids[Variable("S")]] == Variable("S")
+
+    assert {grammar.variables[head] for head in grammar.nullable_heads} == (
+        wcnf.epsilon_heads
+    )
+    for terminal, heads in wcnf.terminal_heads.items():
+        assert {
+            grammar.variables[head]
+            for head in iter_bits(grammar.terminal_heads[terminal])
+        } == heads
+    assert {
+        (grammar.variables[left], grammar.variables[right]): {
+            grammar.variables[head] for head in heads
+        }
+        for (left, right), heads in (
+            (divmod(pair, k), heads) for pair, heads in grammar.pair_heads.items()
+        )
+    } == wcnf.pair_heads
+
+
+def test_get_cnf():
+    cfg = CFG.from_text("S -> a S b S | epsilon")
+    cnf = get_cnf(cfg)
+
+    assert cnf.generates_epsilon
+    assert get_cnf(CFG.from_text("S -> a S b S | epsilon")) is cnf
+    for production in cnf.cfg.productions:
+        assert len(production.body) in (1, 2)
@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from project.cfpq import *
 from project.graph_utils import create_labeled_two_cycles_graph
 
@@ -149,3 +151,141 @@ B -> b
         graph,
     )
     assert result == {0: {0, 3}, 1: {0, 3}, 2: {0, 3}, 3: set()}
+
+
+def test_hellings_equals_matrix():
+    cfg = CFG.from_text(
+        """
+S -> A B
+S -> A S1
+S1 -> S B
+A -> a
+B -> b
+"""
+    )
+    graph = create_labeled_two_cycles_graph(3, 2)
+    assert hellings(cfg, graph) == matrix_mult(cfg, graph)
+
+
+def test_semi_naive_equals_matrix():
+    cfg = CFG.from_text(
+        """
+S -> A B
+S -> A S1
+S1 -> S B
+S -> epsilon
+A -> a
+B -> b
+"""
+    )
+    graph = create_labeled_two_cycles_graph(3, 2)
+    assert matrix_semi_naive(cfg, graph) == matrix_mult(cfg, graph)
+
+    with ThreadPoolExecutor(4) as executor:
+        expected = matrix_mult(cfg, graph)
+        assert matrix_mult(cfg, graph, executor) == expected
+        assert matrix_semi_naive(cfg, graph, executor) == expected
+
+
+def test_cfpq_semi_naive():
+    cfg = CFG.from_text(
+        """
+S -> A B
+S -> A S1
+S1 -> S B
+A -> a
+B -> b
+"""
+    )
+    graph = create_labeled_two_cycles_graph(2, 1)
+    result = cfpq(cfg, graph, algo=cfpqAlgo.SEMI_NAIVE)
+    assert result == {0: {0, 3}, 1: {0, 3}, 2: {0, 3}, 3: set()}
+
+
+def test_tensor_equals_hellings():
+    cfg = CFG.from_text(
+        """
+S -> A B
+S -> A S1
+S1 -> S B
+A -> a
+B -> b
+"""
+    )
+    for n, m in [(2, 1), (3, 2), (4, 3)]:
+        graph = create_labeled_two_cycles_graph(n, m)
+        assert tensor(cfg, graph) == hellings(cfg, graph)
+
+
+def test_cfpq_tensor():
+    cfg = CFG.from_text(
+        """
+S -> a S b S
+S -> epsilon
+"""
+    )
+    graph = create_labeled_two_cycles_graph(2, 1)
+    assert cfpq(cfg, graph, algo=cfpqAlgo.TENSOR) == cfpq(cfg, graph)
+
+
+def test_iter_cfpq_and_cfpq_matrix():
+    cfg = CFG.from_text(
+        """
+S -> A B
+S -> A S1
+S1 -> S B
+A -> a
+B -> b
+"""
+    )
+    graph = create_labeled_two_cycles_graph(3, 2)
+    for algo in [
+        cfpqAlgo.HELLINGS,
+        cfpqAlgo.MATRIX,
+        cfpqAlgo.SEMI_NAIVE,
+        cfpqAlgo.TENSOR,
+        cfpqAlgo.DEMAND,
+    ]:
+        expected = {
+            (u, v)
+            for u, reachable in cfpq(cfg, graph, {0, 1}, {0, 4}, algo=algo).items()
+            for v in reachable
+        }
+        assert set(iter_cfpq(cfg, graph, {0, 1}, {0, 4}, algo=algo, block_size=1)) == (
+            expected
+        )
+
+        matrix, nodes = cfpq_matrix(cfg, graph, {0, 1}, {0, 4}, algo=algo)
+        rows, cols = matrix.nonzero()
+        assert set(zip(nodes[rows], nodes[cols])) == expected
+
+
+def test_demand_driven():
+    cfg = CFG.from_text(
+        """
+S -> A S B | A B | epsilon
+A -> a
+B -> b
+"""
+    )
+    graph = create_labeled_two_cycles_graph(3, 2)
+    graph.add_edge(100, 101, label="a")
+    graph.add_edge(101, 100, label="b")
+    facts = hellings(cfg, graph)
+
+    for start_nodes in [{0}, {1, 4}, {100}, None]:
+        result = demand_driven(cfg, graph, start_nodes, Variable("S"))
+        assert result <= facts
+        selected = start_nodes or set(graph.nodes)
+        assert {fact for fact in result if fact[0] in selected and fact[1] == "S"} == {
+            fact for fact in facts if fact[0] in selected and fact[1] == "S"
+        }
+        assert cfpq(cfg, graph, start_nodes, algo=cfpqAlgo.DEMAND) == cfpq(
+            cfg, graph, start_nodes
+        )
+
+    assert all(u not in (100, 101) for u, _, _ in demand_driven(cfg, graph, {0}))
+    matrix, nodes = cfpq_matrix(cfg, graph, {100}, algo=cfpqAlgo.DEMAND)
+    assert nodes.tolist() == [100]
+    assert matrix.nnz == 1
+    assert demand_driven(cfg, graph, {0}, Variable("X")) == set()
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+from networkx import MultiDiGraph
+from pyformlang.cfg import CFG, Variable
+
+from project.cfpq import cfpq, cfpqAlgo
+from project.cfpq_index import CFPQIndex
+from project.graph_utils import create_labeled_two_cycles_graph
+
+CFG_TEXT = """
+S -> A S B | A B | epsilon
+A -> a
+B -> b
+"""
+
+
+def assert_index_equals_cfpq(index: CFPQIndex, cfg: CFG, graph: MultiDiGraph):
+    for symbol in [Variable("S"), Variable("A"), Variable("B")]:
+        assert index.query(graph.nodes, symbol=symbol) == cfpq(
+            cfg, graph, graph.nodes, symbol=symbol
+        )
+
+
+@pytest.mark.parametrize(
+    "algo", [cfpqAlgo.HELLINGS, cfpqAlgo.MATRIX, cfpqAlgo.SEMI_NAIVE]
+)
+def test_build(algo):
+    cfg = CFG.from_text(CFG_TEXT)
+    graph = create_labeled_two_cycles_graph(3, 2)
+    assert_index_equals_cfpq(CFPQIndex(cfg, graph, algo), cfg, graph)
+
+
+def test_add_and_remove_edges():
+    cfg = CFG.from_text(CFG_TEXT)
+    graph = create_labeled_two_cycles_graph(3, 2)
+    index = CFPQIndex(cfg, graph)
+
+    index.add_edges([(0, 10, "b"), (10, 11, "b")])
+    graph.add_edge(0, 10, label="b")
+    graph.add_edge(10, 11, label="b")
+    assert_index_equals_cfpq(index, cfg, graph)
+    assert 11 in index.query({1})[1]
+    matrix, nodes = index.query_matrix()
+    rows, cols = matrix.nonzero()
+    assert set(zip(nodes[rows], nodes[cols])) == {
+        (u, v) for u, reachable in index.query().items() for v in reachable
+    }
+
+    # parallel edge keeps the fact after one of them is removed
+    index.add_edges([(0, 10, "b")])
+    index.remove_edges([(0, 10, "b")])
+    assert_index_equals_cfpq(index, cfg, graph)
+
+    index.remove_edges([(0, 10, "b"), (0, 1, "a")])
+    graph.remove_edge(0, 10)
+    graph.remove_edge(0, 1)
+    assert_index_equals_cfpq(index, cfg, graph)
+
+    with pytest.raises(ValueError):
+        index.remove_edges([(0, 1, "a")])
+
+
+def test_random_updates():
+    cfg = CFG.from_text(CFG_TEXT)
+    generator = random.Random(42)
+    graph = MultiDiGraph()
+    graph.add_nodes_from(range(8))
+    index = CFPQIndex(cfg, graph)
+    edges = []
+    for _ in range(60):
+        if len(edges) > 0 and generator.random() < 0.4:
+            u, v, label = edges.pop(generator.randrange(len(edges)))
+            index.remove_edges([(u, v, label)])
+            key = next(
+                key for key, value in graph[u][v].items() if value["label"] == label
+            )
+            graph.remove_edge(u, v, key)
+        else:
+            edge = (
+                generator.randrange(8),
+                generator.randrange(8),
+                generator.choice("ab"),
+            )
+            edges.append(edge)
+            index.add_edges([edge])
+            graph.add_edge(edge[0], edge[1], label=edge[2])
+        assert_index_equals_cfpq(index, cfg, graph)
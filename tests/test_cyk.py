@@ -0,0 +1,77 @@
+import itertools
+from tempfile import NamedTemporaryFile
+from textwrap import dedent
+
+import pytest
+from pyformlang.cfg import CFG
+
+from project.cyk import CYKRecognizer, cyk, cyk_from_file
+
+GRAMMARS = [
+    """
+    S -> a S b S | epsilon
+    """,
+    """
+    S -> A S B | A B
+    A -> a
+    B -> b
+    """,
+    """
+    S -> S S | a | b S a
+    """,
+    """
+    S -> A B
+    A -> a
+    B -> B
+    """,
+]
+
+
+@pytest.mark.parametrize("text", GRAMMARS)
+def test_cyk_equals_contains(text):
+    cfg = CFG.from_text(dedent(text))
+    recognizer = CYKRecognizer(cfg)
+    words = [
+        "".join(word)
+        for length in range(7)
+        for word in itertools.product("ab", repeat=length)
+    ]
+    expected = [cfg.contains(word) for word in words]
+
+    assert [recognizer.accepts(word) for word in words] == expected
+    assert recognizer.accepts_many(words).tolist() == expected
+    assert cyk(cfg, "") == cfg.generate_epsilon()
+
+
+def test_cyk_tokens():
+    cfg = CFG.from_text("S -> if S then S | skip")
+    recognizer = CYKRecognizer(cfg)
+
+    assert recognizer.accepts(["if", "skip", "then", "skip"])
+    assert not recognizer.accepts(["if", "skip", "then"])
+    assert not recognizer.accepts(["if", "skip", "then", "unknown"])
+    assert recognizer.accepts_many(
+        [["skip"], "skip", ["if", "skip", "then", "skip"], []]
+    ).tolist() == [True, False, True, False]
+
+
+def test_cyk_from_file():
+    with NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("S -> a S b | epsilon")
+    assert cyk_from_file(f.name, "aabb")
+    assert cyk_from_file(f.name, "")
+    assert not cyk_from_file(f.name, "aab")
+    assert CYKRecognizer.from_file(f.name).accepts("ab")
+
+
+def test_cyk_chunks_and_many_variables():
+    # more than 64 variables take several words per cell
+    rules = [f"S{i} -> a S{i + 1} b | a b" for i in range(70)] + ["S70 -> c"]
+    cfg = CFG.from_text("\n".join(["S -> S0"] + rules))
+    recognizer = CYKRecognizer(cfg)
+    words = ["a" * n + "b" * n for n in range(1, 6)] + ["aabbb", "ab", "ba", ""]
+    expected = [cfg.contains(word) for word in words]
+
+    assert recognizer.words_per_cell > 1
+    assert recognizer.accepts_many(words, chunk_size=1).tolist() == expected
+    assert recognizer.accepts_many(words * 3, chunk_size=2).tolist() == expected * 3
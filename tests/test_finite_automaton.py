@@ -1,3 +1,5 @@
+import pickle
+
 import pytest
 import project.finite_automaton as fa
 import project.graph_utils as gu
@@ -36,3 +38,13 @@ def test_graph_to_nfa():
     assert graph_bzip.number_of_nodes() == len(nfa_from_bzip.states)
     assert nfa_from_bzip.start_states == start_states
     assert nfa_from_bzip.final_states == final_states
+
+
+def test_dfa_values_round_trip():
+    dfa = fa.regex_to_dfa("a* (b | c)")
+    values = pickle.loads(pickle.dumps(fa.dfa_to_values(dfa)))
+    restored = fa.dfa_from_values(values)
+
+    assert restored.is_equivalent_to(dfa)
+    assert len(restored.states) == len(dfa.states)
+    assert fa.symbols_from_values(fa.to_values(dfa.symbols)) == list(dfa.symbols)
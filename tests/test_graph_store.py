@@ -0,0 +1,80 @@
+import subprocess
+import sys
+
+import numpy as np
+from networkx import MultiDiGraph
+from pyformlang.finite_automaton import State, Symbol
+
+from project.bit_matrix import to_sparse
+from project.bool_matrices import BoolMatrices, VertexStatesIndices
+from project.graph_store import open_graph_store, write_graph_store
+from project.graph_utils import create_labeled_two_cycles_graph
+import project.finite_automaton as fa
+
+
+def assert_same(bm, expected):
+    assert bm.count_of_states == expected.count_of_states
+    assert dict(bm.states_indices.items()) == expected.states_indices
+    assert set(bm.start_states) == expected.start_states
+    assert set(bm.final_states) == expected.final_states
+    assert bm.bool_matrices.keys() == expected.bool_matrices.keys()
+    for label, matrix in expected.bool_matrices.items():
+        assert (bm.bool_matrices[label] != to_sparse(matrix)).nnz == 0
+
+
+def test_round_trip(tmp_path):
+    graph = create_labeled_two_cycles_graph(20, 19)
+    for start_states, final_states in [(None, None), ({0, 3}, {5})]:
+        expected = BoolMatrices.from_graph(graph, start_states, final_states)
+        write_graph_store(expected, tmp_path / "graph")
+        bm = open_graph_store(tmp_path / "graph")
+        assert_same(bm, expected)
+        assert not bm.bool_matrices[Symbol("a")].indices.flags.writeable
+
+        dfa = BoolMatrices(fa.regex_to_dfa("a* (b | c)"))
+        assert bm.reachability_bfs_rpq(dfa, True) == expected.reachability_bfs_rpq(
+            dfa, True
+        )
+
+
+def test_states_absent_from_graph(tmp_path):
+    graph = create_labeled_two_cycles_graph(5, 4)
+    expected = BoolMatrices.from_graph(graph, {0, 3, 100}, {5, 200})
+    write_graph_store(expected, tmp_path / "graph")
+    bm = open_graph_store(tmp_path / "graph")
+    assert set(bm.start_states) == {State(0), State(3)}
+    assert set(bm.final_states) == {State(5)}
+    assert (bm.start_indicator() == expected.start_indicator()).all()
+    assert (bm.final_indicator() == expected.final_indicator()).all()
+
+
+def test_string_vertices(tmp_path):
+    graph = MultiDiGraph()
+    graph.add_edges_from([("x", "y", {"label": "a"}), ("y", "z", {"label": "b"})])
+    expected = BoolMatrices.from_graph(graph)
+    write_graph_store(expected, tmp_path / "graph")
+    assert_same(open_graph_store(tmp_path / "graph"), expected)
+
+
+def test_vertex_states_indices():
+    indices = VertexStatesIndices(np.array([7, 2, 9]))
+    assert indices[State(2)] == 1
+    assert indices[9] == 2
+    assert State(3) not in indices
+    assert "x" not in indices
+    assert list(indices.items()) == [(State(7), 0), (State(2), 1), (State(9), 2)]
+
+
+def test_open_in_another_process(tmp_path):
+    expected = BoolMatrices.from_graph(create_labeled_two_cycles_graph(20, 19))
+    write_graph_store(expected, tmp_path / "graph")
+    code = (
+        "from project.graph_store import open_graph_store\n"
+        "from pyformlang.finite_automaton import Symbol\n"
+        f"bm = open_graph_store({str(tmp_path / 'graph')!r})\n"
+        "print(bm.bool_matrices[Symbol('a')].nnz)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.split()[-1] == str(expected.bool_matrices[Symbol("a")].nnz)
@@ -1,5 +1,11 @@
+import json
+import os
+
 import pytest
+import cfpq_data
 import project.graph_utils as graphU
+from project.bit_matrix import to_sparse
+from project.bool_matrices import BoolMatrices
 from tempfile import NamedTemporaryFile
 
 
@@ -36,3 +42,62 @@ def test_save_labeled_two_cycles_graph():
 }\n"""
 
         assert output == excepted
+
+
+def test_get_graph_decomposition_by_name(tmp_path):
+    csv_path = tmp_path / "graph.csv"
+    csv_path.write_text("0 1 a\n1 2 b\n2 0 a\n2 3 c\n")
+    cache_dir = tmp_path / "cache"
+
+    expected = BoolMatrices.from_graph(cfpq_data.graph_from_csv(csv_path))
+    for _ in range(2):
+        bm = graphU.get_graph_decomposition_by_name(str(csv_path), cache_dir)
+        assert bm.states_indices == expected.states_indices
+        assert bm.bool_matrices.keys() == expected.bool_matrices.keys()
+        for label, matrix in expected.bool_matrices.items():
+            assert (bm.bool_matrices[label] != to_sparse(matrix)).nnz == 0
+    assert len(list(cache_dir.iterdir())) == 1
+
+    csv_path.write_text("0 1 a\n")
+    bm = graphU.get_graph_decomposition_by_name(str(csv_path), cache_dir)
+    assert bm.count_of_states == 2
+    assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_get_graph_info_from_csv(tmp_path):
+    csv_path = tmp_path / "graph.csv"
+    csv_path.write_text("0 1 a\n1 2 b\n2 0 a\n2 3 c\n0 1 a\n")
+
+    for chunk_size in [2, 3, 100]:
+        info = graphU.get_graph_info_from_csv(csv_path, chunk_size, use_cache=False)
+        assert info.number_of_vertices == 4
+        assert info.number_of_edges == 5
+        assert info.labels == {"a", "b", "c"}
+        assert info.label_counts == {"a": 3, "b": 1, "c": 1}
+        assert info.out_degree == graphU.DegreeSummary(0, 2, 1.25, 1.5)
+        assert info.in_degree == graphU.DegreeSummary(1, 2, 1.25, 1.0)
+    assert not (tmp_path / "graph.csv.info.json").exists()
+
+
+def test_get_graph_info_from_csv_cache(tmp_path):
+    csv_path = tmp_path / "graph.csv"
+    cache_path = tmp_path / "graph.csv.info.json"
+    csv_path.write_text("0 1 a\n1 2 b\n")
+    expected = graphU.get_graph_info_from_csv(csv_path)
+    assert cache_path.exists()
+
+    # a hit returns the stored info without reading the csv
+    cached = json.loads(cache_path.read_text())
+    cached["info"]["number_of_edges"] = 100
+    cache_path.write_text(json.dumps(cached))
+    assert graphU.get_graph_info_from_csv(csv_path).number_of_edges == 100
+    assert graphU.get_graph_info_from_csv(csv_path, use_cache=False) == expected
+
+    # changed modification time invalidates the entry
+    stat = csv_path.stat()
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert graphU.get_graph_info_from_csv(csv_path) == expected
+
+    # changed size invalidates the entry
+    csv_path.write_text("0 1 a\n")
+    assert graphU.get_graph_info_from_csv(csv_path).number_of_edges == 1
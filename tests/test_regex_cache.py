@@ -0,0 +1,56 @@
+import subprocess
+import sys
+
+from project.regex_cache import RegexCache
+import project.finite_automaton as fa
+
+
+def test_canonicalize():
+    assert RegexCache.canonicalize(" a *  ( b | c )  d ") == "a*(b|c)d"
+    assert RegexCache.canonicalize("a  b") == "a b"
+    for regex in ["a * (b | c)", "( ab  cd ) * ef", "a . b*  c"]:
+        canonical = RegexCache.canonicalize(regex)
+        assert fa.regex_to_dfa(regex).is_equivalent_to(fa.regex_to_dfa(canonical))
+
+
+def test_lru():
+    cache = RegexCache(maxsize=2)
+    dfa = cache.dfa("a b*")
+    assert dfa.is_equivalent_to(fa.regex_to_dfa("a b*"))
+    assert cache.bool_matrices("a  b *") is cache.bool_matrices("a b*")
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    cache.dfa("c")
+    cache.dfa("d")
+    assert len(cache) == 2
+    cache.dfa("a b*")
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_persistence(tmp_path):
+    first = RegexCache(directory=tmp_path)
+    expected = first.dfa("(a | b)* c")
+    assert first.misses == 1
+
+    second = RegexCache(directory=tmp_path)
+    dfa, bool_matrices = second.get("(a|b)*c")
+    assert (second.hits, second.misses) == (1, 0)
+    assert dfa.is_equivalent_to(expected)
+    assert (
+        bool_matrices.count_of_states == first.bool_matrices("(a|b)*c").count_of_states
+    )
+
+
+def test_persistence_across_processes(tmp_path):
+    RegexCache(directory=tmp_path).dfa("(a | b)* c")
+    code = (
+        "from project.regex_cache import RegexCache\n"
+        "import project.finite_automaton as fa\n"
+        f"cache = RegexCache(directory={str(tmp_path)!r})\n"
+        "dfa, bool_matrices = cache.get('(a|b)*c')\n"
+        "assert cache.misses == 0\n"
+        "assert dfa.is_equivalent_to(fa.regex_to_dfa('(a|b)*c'))\n"
+        "assert dfa.accepts('abac') and not dfa.accepts('ab')\n"
+        "assert bool_matrices.bool_matrices.keys() == {'a', 'b', 'c'}\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -1,3 +1,4 @@
+import pytest
 from networkx import MultiDiGraph
 import project.regular_request as rr
 import project.finite_automaton as fa
@@ -106,3 +107,111 @@ def bfs_requests_to_graph_4():
         ]
     )
     assert rr.bfs_requests_to_graph("", graph, False) == set()
+
+
+def test_reachability_requests_to_graph():
+    graph = MultiDiGraph()
+    graph.add_edges_from(
+        [
+            (0, 1, {"label": "c"}),
+            (0, 2, {"label": "a"}),
+            (1, 2, {"label": "a"}),
+            (2, 2, {"label": "b"}),
+            (2, 3, {"label": "c"}),
+            (3, 1, {"label": "a"}),
+        ]
+    )
+    for regex in ["a.b*", "a*b*", "(a|c)*", "c a b* c"]:
+        # vertex 5 is not in the graph
+        for start_states in [{0}, {0, 1}, {1, 3}, {0, 5}]:
+            expected = rr.regular_requests_to_graph(regex, graph, start_states)
+            got = rr.reachability_requests_to_graph(regex, graph, True, start_states)
+            assert got == expected
+            got = rr.regular_requests_to_graph(regex, graph, start_states, lazy=True)
+            assert got == expected
+
+            expected = {node for _, node in expected}
+            got = rr.reachability_requests_to_graph(regex, graph, False, start_states)
+            assert got == expected
+
+
+def test_reachability_requests_to_empty_graph():
+    graph = MultiDiGraph()
+    assert rr.reachability_requests_to_graph("a b", graph, False) == set()
+    assert rr.reachability_requests_to_graph("a b", graph, True) == set()
+
+
+def test_iter_regular_requests_to_graph():
+    graph = MultiDiGraph()
+    graph.add_edges_from(
+        [
+            (0, 1, {"label": "a"}),
+            (1, 2, {"label": "b"}),
+            (2, 0, {"label": "a"}),
+            (2, 3, {"label": "b"}),
+        ]
+    )
+    expected = rr.regular_requests_to_graph("(a b)*", graph)
+    assert expected == {(0, 2)}
+    assert rr.regular_requests_to_graph("(a b)*", graph, lazy=True) == expected
+    assert set(rr.iter_regular_requests_to_graph("(a b)*", graph, block_size=1)) == (
+        expected
+    )
+
+    matrix, vertices = rr.regular_requests_to_graph_matrix("(a b)*", graph)
+    rows, cols = matrix.nonzero()
+    assert set(zip(vertices[rows], vertices[cols])) == expected
+
+    assert set(
+        rr.iter_reachability_requests_to_graph("(a b)*", graph, True, {0, 1})
+    ) == rr.reachability_requests_to_graph("(a b)*", graph, True, {0, 1})
+    assert set(
+        rr.iter_reachability_requests_to_graph("(a b)*", graph, False, {0, 1})
+    ) == {2}
+
+
+def test_partitioned_requests_to_graph():
+    graph = MultiDiGraph()
+    graph.add_edges_from(
+        [
+            (0, 1, {"label": "c"}),
+            (0, 2, {"label": "a"}),
+            (1, 2, {"label": "a"}),
+            (2, 2, {"label": "b"}),
+            (2, 3, {"label": "c"}),
+            (3, 1, {"label": "a"}),
+        ]
+    )
+    for regex in ["a.b*", "(a|c)*", "c a b* c"]:
+        # vertex 5 is not in the graph
+        for start_states in [None, {0}, {1, 3}, {1, 5}]:
+            expected = rr.regular_requests_to_graph(regex, graph, start_states)
+            got = rr.partitioned_requests_to_graph(
+                regex, graph, start_states, processes=2, shards=3
+            )
+            assert got == expected
+
+
+def test_batch_requests_to_graph():
+    graph = MultiDiGraph()
+    graph.add_edges_from(
+        [
+            (0, 1, {"label": "a"}),
+            (1, 2, {"label": "a"}),
+            (2, 0, {"label": "a"}),
+            (0, 3, {"label": "b"}),
+            (3, 4, {"label": "b"}),
+            (4, 0, {"label": "b"}),
+        ]
+    )
+    regexes = ["a*", "a b*", "(a|b)* b", "c", "", "a*"]
+    # vertex 5 is not in the graph
+    for start_states, final_states in [(None, None), ({0, 1}, {0, 4}), ({0, 5}, None)]:
+        batch = rr.batch_requests_to_graph(regexes, graph, start_states, final_states)
+        assert batch.results == [
+            rr.regular_requests_to_graph(regex, graph, start_states, final_states)
+            for regex in regexes
+        ]
+        assert batch.time_per_query == pytest.approx(batch.total_time / len(regexes))
+
+    assert rr.batch_requests_to_graph([], graph).results == []